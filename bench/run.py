@@ -0,0 +1,162 @@
+"""Benchmarks of the parser, the generators and the command line.
+
+    python bench/run.py                      # compare with bench/baseline.json
+    python bench/run.py --save               # record a new baseline
+    python bench/run.py --output result.json
+
+Each benchmark is timed several times, for at least a second, and its
+best time kept. A fixed pure Python loop is timed between its runs, as a
+calibration: a benchmark is compared with its baseline as a multiple of
+the calibration, so that the speed of the machine, or its load at the
+time, cancels out. The run fails when a benchmark is slower than its
+baseline by more than the tolerance, and by more than the noise.
+"""
+
+import argparse
+import json
+import os.path
+import subprocess
+import sys
+import time
+
+folder = os.path.dirname(os.path.realpath(__file__))
+root = os.path.dirname(folder)
+sys.path.insert(0, root)
+
+import exprparse
+import generator
+
+
+BASELINE = os.path.join(folder, "baseline.json")
+
+SHORT_PATTERN = "MPL-[1-999|z]-IDR-[1-4]"
+LONG_PATTERN = "".join("F{}-[1-{}|3z]/".format(i, i + 9) for i in range(200))
+# 90000 identifiers, so that filling it stays quick
+FILL_PATTERN = "ID-[1-300|z]-[1-300|z]"
+FILL_RATIOS = (0.01, 0.5, 0.9, 1.0)
+CLI_PATTERN = "DOC-[1-99999999|8z]"
+CLI_COUNT = 1000000
+# slowdowns under this many seconds are taken as noise
+NOISE = 0.02
+# short benchmarks are timed again until they ran this many seconds
+MIN_DURATION = 1.0
+
+
+def calibration():
+    totals = {}
+    for i in range(100000):
+        totals[i % 1000] = totals.get(i % 1000, 0) + i
+
+
+def best_time(function, repeat):
+    """Return the best times of a function and of the calibration, timed in turn."""
+    best = best_calibration = float("inf")
+    timings = 0
+    total = 0.0
+    while timings < repeat or total < MIN_DURATION:
+        begin = time.perf_counter()
+        calibration()
+        middle = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - middle
+        best_calibration = min(best_calibration, middle - begin)
+        best = min(best, elapsed)
+        timings += 1
+        total += elapsed
+    return {"seconds": best, "calibration": best_calibration}
+
+
+def bench_parse(repeat):
+    def parse(expression, times):
+        def run():
+            for _ in range(times):
+                exprparse.Source(expression).parse_and_build()
+        return run
+    return {
+        "parse.short.x1000": best_time(parse(SHORT_PATTERN, 1000), repeat),
+        "parse.long.x10": best_time(parse(LONG_PATTERN, 10), repeat),
+    }
+
+
+def bench_fill(repeat):
+    fields = exprparse.Source(FILL_PATTERN).parse_and_build()
+    space = generator.combinatory_space(fields)
+    results = {}
+    for ratio in FILL_RATIOS:
+        limit = int(space * ratio)
+
+        def run():
+            list(generator.IdentifierGenerator(fields, limit, seed=1))
+        results["generate.fill.{}%".format(int(ratio * 100))] = best_time(run, repeat)
+    return results
+
+
+def bench_cli(repeat):
+    command = [sys.executable, os.path.join(root, "idgen.py"), CLI_PATTERN,
+               "--count", str(CLI_COUNT), "--seed", "1"]
+
+    def run():
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True, cwd=root)
+    return {"cli.devnull.1M": best_time(run, repeat)}
+
+
+BENCHMARKS = {"parse": bench_parse, "fill": bench_fill, "cli": bench_cli}
+
+
+def compare(results, baseline, tolerance):
+    """Return a line for each benchmark slower than its baseline.
+
+    The baseline is scaled by the calibration timed along each benchmark.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        seconds = result["seconds"]
+        reference = (baseline[name]["seconds"] * result["calibration"]
+                     / baseline[name]["calibration"])
+        if seconds > max(reference * (1 + tolerance), reference + NOISE):
+            regressions.append("{}: {:.4f}s instead of {:.4f}s (+{:.0%})"
+                               .format(name, seconds, reference, seconds / reference - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append",
+                        help="Run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timings of each benchmark")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown over the baseline, as a ratio")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--output", metavar="FILE", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or sorted(BENCHMARKS):
+        results.update(BENCHMARKS[name](args.repeat))
+    for name, result in sorted(results.items()):
+        print("{:<24} {:.4f}s  ({:.2f} calibrations)"
+              .format(name, result["seconds"], result["seconds"] / result["calibration"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare with, save one with --save", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for line in regressions:
+        print("REGRESSION " + line, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+
+import json
+import os
+import struct
+import tempfile
+
+
+MAGIC = b"IDGENCK1"
+
+
+def save(path, state, payload=b""):
+    """Write a checkpoint file made of a JSON-able state and raw bytes.
+
+    The file is written aside then renamed over the previous one, so a
+    reader sees either the previous checkpoint or the new one, never a
+    partial one.
+    """
+    header = json.dumps(state).encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def load(path):
+    """Read a checkpoint file, return its state and raw bytes."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("'{}' is not a checkpoint file".format(path))
+        size, = struct.unpack("<Q", f.read(8))
+        state = json.loads(f.read(size).decode("utf-8"))
+        payload = f.read()
+    return state, payload
@@ -0,0 +1,347 @@
+
+import array
+import bisect
+import hashlib
+import math
+
+
+# bitmap is preferred as soon as it is smaller than a sorted array
+BITS_PER_RANK = 64
+# below this space (in bits), the bitmap is small enough to be used from start
+SMALL_SPACE = 2**18
+CHUNK_SIZE = 4096
+# number of bits set in each byte value
+BIT_COUNTS = bytes(bin(byte).count("1") for byte in range(256))
+
+
+class BitmapStore:
+    """Set of ranks as a bitmap, one bit per possible rank."""
+
+    def __init__(self, space, ranks=()):
+        self.space = space
+        self.bits = bytearray((space + 7) // 8)
+        self.size = 0
+        for rank in ranks:
+            self.add(rank)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, rank):
+        return bool(self.bits[rank >> 3] >> (rank & 7) & 1)
+
+    def __iter__(self):
+        for byte_index, byte in enumerate(self.bits):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield (byte_index << 3) | bit
+
+    def insert(self, rank):
+        """Add the rank, return whether it was missing."""
+        byte_index = rank >> 3
+        bit = 1 << (rank & 7)
+        if self.bits[byte_index] & bit:
+            return False
+        self.bits[byte_index] |= bit
+        self.size += 1
+        return True
+
+    add = insert
+
+    def insert_sorted(self, ranks):
+        """Add distinct ranks, a NumPy array, return a mask of the missing ones."""
+        import numpy
+        bits = numpy.frombuffer(self.bits, dtype=numpy.uint8)
+        byte_indexes = ranks >> 3
+        masks = numpy.left_shift(1, ranks & 7).astype(numpy.uint8)
+        missing = bits[byte_indexes] & masks == 0
+        # several ranks may share a byte
+        numpy.bitwise_or.at(bits, byte_indexes[missing], masks[missing])
+        self.size += int(missing.sum())
+        return missing
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    def dump(self):
+        return bytes(self.bits)
+
+    @classmethod
+    def load(cls, space, data):
+        store = cls(space)
+        store.bits[:] = data
+        store.size = sum(data.translate(BIT_COUNTS))
+        return store
+
+
+class ChunkedArrayStore:
+    """Set of ranks as sorted chunks of unsigned 64-bit integers.
+
+    Chunks are split in two when they grow past twice the chunk size, so an
+    insertion only moves a few kilobytes of memory.
+    """
+
+    def __init__(self, ranks=()):
+        self.chunks = []
+        self.heads = []
+        self.size = 0
+        for rank in ranks:
+            self.add(rank)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, rank):
+        i = bisect.bisect_right(self.heads, rank) - 1
+        if i < 0:
+            return False
+        chunk = self.chunks[i]
+        j = bisect.bisect_left(chunk, rank)
+        return j < len(chunk) and chunk[j] == rank
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def insert(self, rank):
+        """Add the rank, return whether it was missing."""
+        if not self.chunks:
+            self.chunks.append(array.array("Q", (rank,)))
+            self.heads.append(rank)
+            self.size += 1
+            return True
+
+        i = bisect.bisect_right(self.heads, rank) - 1
+        if i < 0:
+            i = 0
+            self.heads[0] = rank
+        chunk = self.chunks[i]
+        j = bisect.bisect_left(chunk, rank)
+        if j < len(chunk) and chunk[j] == rank:
+            return False
+        chunk.insert(j, rank)
+        self.size += 1
+
+        if len(chunk) >= 2 * CHUNK_SIZE:
+            upper = chunk[CHUNK_SIZE:]
+            del chunk[CHUNK_SIZE:]
+            self.chunks.insert(i + 1, upper)
+            self.heads.insert(i + 1, upper[0])
+        return True
+
+    add = insert
+
+    def insert_sorted(self, ranks):
+        """Add sorted distinct ranks, a NumPy array, return a mask of the missing ones.
+
+        Each chunk is merged at once with the ranks falling in it, the first
+        chunk also taking the ranks below its head.
+        """
+        import numpy
+        ranks = ranks.astype(numpy.uint64)
+        missing = numpy.ones(len(ranks), dtype=bool)
+        if not self.chunks:
+            self.chunks.append(array.array("Q"))
+        bounds = numpy.searchsorted(ranks, numpy.array(self.heads[1:], dtype=numpy.uint64))
+        chunks = []
+        for chunk, begin, end in zip(self.chunks, [0] + bounds.tolist(),
+                                     bounds.tolist() + [len(ranks)]):
+            if begin == end:
+                chunks.append(chunk)
+                continue
+            added = ranks[begin:end]
+            if chunk:
+                present = numpy.frombuffer(chunk, dtype=numpy.uint64)
+                found = present[numpy.searchsorted(present, added).clip(max=len(present) - 1)]
+                missing[begin:end] = found != added
+                added = numpy.concatenate((present, added[missing[begin:end]]))
+                added.sort()
+            step = CHUNK_SIZE if len(added) >= 2 * CHUNK_SIZE else len(added)
+            for i in range(0, len(added), step):
+                chunks.append(array.array("Q", added[i:i + step].tobytes()))
+        self.chunks = chunks
+        self.heads = [chunk[0] for chunk in chunks]
+        self.size += int(missing.sum())
+        return missing
+
+    @property
+    def nbytes(self):
+        return sum(chunk.itemsize * len(chunk) for chunk in self.chunks)
+
+    def dump(self):
+        return b"".join(chunk.tobytes() for chunk in self.chunks)
+
+    @classmethod
+    def load(cls, data):
+        ranks = array.array("Q")
+        ranks.frombytes(data)
+        store = cls()
+        store.chunks = [ranks[i:i + CHUNK_SIZE] for i in range(0, len(ranks), CHUNK_SIZE)]
+        store.heads = [chunk[0] for chunk in store.chunks]
+        store.size = len(ranks)
+        return store
+
+
+class SetStore(set):
+    """Set of ranks, for spaces too wide for 64-bit integers."""
+
+    def insert(self, rank):
+        """Add the rank, return whether it was missing."""
+        if rank in self:
+            return False
+        self.add(rank)
+        return True
+
+    def dump(self, width):
+        return b"".join(rank.to_bytes(width, "little") for rank in self)
+
+    @classmethod
+    def load(cls, width, data):
+        return cls(int.from_bytes(data[i:i + width], "little")
+                   for i in range(0, len(data), width))
+
+
+class AdaptiveStore:
+    """Set of ranks switching from a sparse to a dense storage as it fills.
+
+    It holds sorted 64-bit ranks (8 bytes per rank) until a bitmap of the
+    whole space (1 bit per possible rank) gets smaller, then moves to it.
+    Spaces too wide for 64-bit ranks are stored in a set.
+    """
+
+    def __init__(self, space):
+        self.space = space
+        self.sparse_limit = None
+        if space <= SMALL_SPACE:
+            self.store = BitmapStore(space)
+        elif space <= 2**64:
+            self.store = ChunkedArrayStore()
+            self.sparse_limit = space // BITS_PER_RANK
+        else:
+            self.store = SetStore()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, rank):
+        return rank in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def insert(self, rank):
+        """Add the rank, return whether it was missing."""
+        if self.sparse_limit is None:
+            return self.store.insert(rank)
+
+        if not self.store.insert(rank):
+            return False
+        if len(self.store) >= self.sparse_limit:
+            self.store = BitmapStore(self.space, self.store)
+            self.sparse_limit = None
+        return True
+
+    add = insert
+
+    def insert_sorted(self, ranks):
+        """Add sorted distinct ranks, a NumPy array, return a mask of the missing ones.
+
+        The ranks are added at once, which is much faster than one by one.
+        Ranks must fit in 64 bits.
+        """
+        missing = self.store.insert_sorted(ranks)
+        if self.sparse_limit is not None and len(self.store) >= self.sparse_limit:
+            self.store = BitmapStore(self.space, self.store)
+            self.sparse_limit = None
+        return missing
+
+    @property
+    def dense(self):
+        return isinstance(self.store, BitmapStore)
+
+    def dump(self):
+        """Return a snapshot of the store, as a JSON-able dict and bytes."""
+        if isinstance(self.store, BitmapStore):
+            return {"kind": "bitmap"}, self.store.dump()
+        if isinstance(self.store, ChunkedArrayStore):
+            return {"kind": "array"}, self.store.dump()
+        return {"kind": "set"}, self.store.dump(self._width)
+
+    def restore(self, meta, data):
+        """Replace the content of the store by a snapshot of it."""
+        kind = meta["kind"]
+        if kind == "bitmap":
+            self.store = BitmapStore.load(self.space, data)
+            self.sparse_limit = None
+        elif kind == "array":
+            self.store = ChunkedArrayStore.load(data)
+        else:
+            self.store = SetStore.load(self._width, data)
+
+    @property
+    def _width(self):
+        return (self.space.bit_length() + 7) // 8
+
+
+class BloomFilter:
+    """Probabilistic set of ranks with a fixed memory footprint.
+
+    A rank may be wrongly reported as present (with the given error rate once
+    `capacity` ranks are added), never wrongly reported as missing. For
+    identifier generation, a false positive only costs an extra draw.
+    """
+
+    def __init__(self, capacity, error_rate):
+        assert 0 < error_rate < 1, "error rate must be in ]0, 1["
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.nbits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _positions(self, rank):
+        digest = hashlib.blake2b(rank.to_bytes((rank.bit_length() + 7) // 8 or 1, "little"),
+                                 digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.nbits for i in range(self.nhashes)]
+
+    def __contains__(self, rank):
+        bits = self.bits
+        return all(bits[p >> 3] >> (p & 7) & 1 for p in self._positions(rank))
+
+    def insert(self, rank):
+        """Add the rank, return whether it was (probably) missing."""
+        bits = self.bits
+        missing = False
+        for p in self._positions(rank):
+            bit = 1 << (p & 7)
+            if not bits[p >> 3] & bit:
+                bits[p >> 3] |= bit
+                missing = True
+        if missing:
+            self.size += 1
+        return missing
+
+    add = insert
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+    def dump(self):
+        """Return a snapshot of the filter, as a JSON-able dict and bytes."""
+        return {"kind": "bloom", "size": self.size}, bytes(self.bits)
+
+    def restore(self, meta, data):
+        """Replace the content of the filter by a snapshot of it."""
+        self.bits[:] = data
+        self.size = meta["size"]
@@ -0,0 +1,133 @@
+
+import functools
+import random
+import secrets
+
+
+@functools.lru_cache(maxsize=None)
+def import_numpy():
+    """Return the NumPy module, or None if it is not installed.
+
+    NumPy is only imported when first needed: importing it takes longer than
+    starting the whole program.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class RandomEngine:
+    """Engine over its own instance of the standard Mersenne Twister."""
+
+    name = "random"
+
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+        self.getrandbits = self.random.getrandbits
+        self.numpy = None
+
+    def randbelow(self, n):
+        """Return a random integer in [0, n[.
+
+        Bounds up to 2**64 use a multiply-shift of 64 random bits, with a
+        rejection only for the few values that would bias the result.
+        """
+        if n > 2**64:
+            return self.random.randrange(n)
+        product = self.getrandbits(64) * n
+        if product & 0xFFFFFFFFFFFFFFFF < n:
+            threshold = (2**64 - n) % n
+            while product & 0xFFFFFFFFFFFFFFFF < threshold:
+                product = self.getrandbits(64) * n
+        return product >> 64
+
+    def numpy_generator(self):
+        """Return a NumPy generator seeded from this engine, if NumPy is there."""
+        numpy = import_numpy()
+        if numpy is None:
+            return None
+        if self.numpy is None:
+            self.numpy = numpy.random.default_rng(self.getrandbits(128))
+        return self.numpy
+
+    def getstate(self):
+        """Return the state of the engine, as a JSON-able dict."""
+        version, internal, gauss = self.random.getstate()
+        return {"random": [version, list(internal), gauss],
+                "numpy": self.numpy.bit_generator.state if self.numpy is not None else None}
+
+    def setstate(self, state):
+        """Restore a state returned by `getstate()`."""
+        if state["numpy"] is not None:
+            self.numpy_generator().bit_generator.state = state["numpy"]
+        version, internal, gauss = state["random"]
+        self.random.setstate((version, tuple(internal), gauss))
+
+
+class SecretsEngine:
+    """Engine over the operating system source of randomness.
+
+    It cannot be seeded, and is much slower than the other engines.
+    """
+
+    name = "secrets"
+
+    def __init__(self, seed=None):
+        if seed is not None:
+            raise ValueError("the secrets engine cannot be seeded")
+
+    def randbelow(self, n):
+        return secrets.randbelow(n)
+
+    def numpy_generator(self):
+        return None
+
+    def getstate(self):
+        return None
+
+    def setstate(self, state):
+        pass
+
+
+class NumpyEngine:
+    """Engine over a NumPy PCG64 generator."""
+
+    name = "numpy"
+
+    def __init__(self, seed=None):
+        numpy = import_numpy()
+        if numpy is None:
+            raise ValueError("the numpy engine requires NumPy")
+        self.generator = numpy.random.Generator(numpy.random.PCG64(seed))
+        self.fallback = random.Random(int(self.generator.integers(2**63)))
+
+    def randbelow(self, n):
+        if n > 2**63:
+            return self.fallback.randrange(n)
+        return int(self.generator.integers(n))
+
+    def numpy_generator(self):
+        return self.generator
+
+    def getstate(self):
+        version, internal, gauss = self.fallback.getstate()
+        return {"numpy": self.generator.bit_generator.state,
+                "random": [version, list(internal), gauss]}
+
+    def setstate(self, state):
+        self.generator.bit_generator.state = state["numpy"]
+        version, internal, gauss = state["random"]
+        self.fallback.setstate((version, tuple(internal), gauss))
+
+
+ENGINES = {e.name: e for e in (RandomEngine, SecretsEngine, NumpyEngine)}
+
+
+def make(name="random", seed=None):
+    """Return a new engine of the given name."""
+    try:
+        return ENGINES[name](seed)
+    except KeyError:
+        raise ValueError("unknown engine '{}'".format(name)) from None
@@ -1,9 +1,22 @@
 
+import collections
 import logging
+import re
+import threading
 
 import generator
 
 
+class PatternError(ValueError):
+    """Invalid expression, with the offset of the faulty character if known."""
+
+    def __init__(self, message, position=None):
+        super().__init__(message if position is None
+                         else "at character {}: {}".format(position, message))
+        self.message = message
+        self.position = position
+
+
 class ExtractSeq:
     """Temporary storage for extracted content from the source."""
 
@@ -19,26 +32,48 @@ class ExtractSeq:
     def int(self, w=10) -> int:
         return int(self.str(), w)
 
+    def __len__(self):
+        return len(self._seq)
+
     def __str__(self):
         return self.str()
 
 
+# a run of text, with escaped characters, or a field like "[1-999|3z]"
+TOKEN = re.compile(r"(?P<text>(?:[^\[\]\\]|\\.)+)"
+                   r"|\[(?P<start>[0-9]+)-(?P<end>[0-9]+)(?:\|(?P<pad_len>[0-9]*)(?P<pad_field>z?))?\]",
+                   re.DOTALL)
+ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+
+
 class Source:
-    """Reader of expression."""
+    """Reader of expression.
+
+    Expressions are scanned by a regular expression, token by token. Those
+    it cannot scan, which are mostly invalid, are read again character by
+    character to tell the error and its offset. Errors raise PatternError.
+    """
 
     def __init__(self, pattern):
         self.log = logging.getLogger("source.parser")
+        self.expression = pattern
         self.pattern = iter(pattern)
         self.curr = None
+        self.position = -1
         self.escaping = None
         self.fields = []
+        self.scanned = None
         self.error = None
+        self.error_position = None
         self.error_if_done = None
 
     def parse_and_build(self):
         self.parse()
         return self.build()
 
+    def parse_and_compile(self):
+        return generator.Pattern(self.parse_and_build(), self.expression)
+
     def consume_escaping(self):
         if self.escaping:
             self.escaping = False
@@ -52,11 +87,49 @@ class Source:
     def parse_error(self, msg):
         assert self.error is None, "internal error (a second parsing error was set without the first be consumed)"
         self.error = msg
+        self.error_position = self.position
 
     def _next(self):
         self.curr = next(self.pattern, None)
+        self.position += 1
 
     def parse(self):
+        if not self.scan():
+            self.parse_chars()
+
+    def scan(self):
+        """Build the fields of the whole expression, or return False."""
+        fields = []
+        expression = self.expression
+        position = 0
+        # told once the whole expression is scanned, as syntax errors come first
+        reversed_field = None
+        while position < len(expression):
+            token = TOKEN.match(expression, position)
+            if token is None:
+                return False
+            text, start, end, pad_len, pad_field = token.groups()
+            if text is not None:
+                if "\\" in text:
+                    text = ESCAPE.sub(r"\1", text)
+                fields.append(generator.FixGenerator(text))
+            else:
+                start, end = int(start), int(end)
+                if start > end:
+                    if reversed_field is None:
+                        reversed_field = token.start()
+                elif pad_field:
+                    pad_len = int(pad_len) if pad_len else len(str(end))
+                    fields.append(generator.RangeGenerator(start, end, pad_len))
+                else:
+                    fields.append(generator.RangeGenerator(start, end, None))
+            position = token.end()
+        if reversed_field is not None:
+            raise PatternError("start of field greater than its end", reversed_field)
+        self.scanned = fields
+        return True
+
+    def parse_chars(self):
         # init parsing
         self._next()
         if self.curr is None:
@@ -67,22 +140,22 @@ class Source:
             self.raise_error_if_any()
             return
         self.fields.append(field)
-        self.log.debug("Start[{}]{}".format(self.curr, field))
+        self.log.debug("Start[%s]%s", self.curr, field)
 
         self._next()
 
         # parsing loop
         while self.curr:
             if field is None:
-                self.log.debug("Search[{}]".format(self.curr))
+                # clear error on unclosed field because the last one did end on purpose
+                self.error_if_done = None
+
+                self.log.debug("Search[%s]", self.curr)
                 field = find_parser(self)
-                self.log.debug("Found[{}]{}".format(self.curr, field))
+                self.log.debug("Found[%s]%s", self.curr, field)
                 self.raise_error_if_any()
                 assert field is not None, "internal error (cannot parse '{}')".format(self.curr)
 
-                # clear error on unclosed field because the last one did end on purpose
-                self.error_if_done = None
-
                 self._next()
                 continue
 
@@ -90,22 +163,28 @@ class Source:
                 self.fields.append(field)
 
             field = field.parse(self)
-            self.log.debug("Loop[{}]{}".format(self.curr, field))
+            self.log.debug("Loop[%s]%s", self.curr, field)
             self.raise_error_if_any()
             self._next()
 
         if field is not None and self.error_if_done:
             self.error = self.error_if_done
+            self.error_position = self.position
             self.raise_error_if_any()
+        # a parser found on the last character is not appended yet
+        if field is not None and field is not self.fields[-1]:
+            self.fields.append(field)
 
     def raise_error_if_any(self):
         if self.error:
-            self.log.debug("Parsing error: {}".format(self.error))
-            exit(1)
+            self.log.debug("Parsing error at character %s: %s", self.error_position, self.error)
+            raise PatternError(self.error, self.error_position)
 
     def build(self):
         assert self.error is None, "internal error (cannot build if error is set)"
-        return tuple(f.build() for f in self.fields)
+        if self.scanned is not None:
+            return generator.fold_fields(self.scanned)
+        return generator.fold_fields(f.build() for f in self.fields)
 
 
 class TextParser:
@@ -119,7 +198,7 @@ class TextParser:
         if source.consume_escaping():
             self.text.add(source.curr)
         elif source.curr == "[":
-            return FieldParser()
+            return FieldParser(source.position)
         elif source.curr == "]":
             source.parse_error("unescaped \"]\"")
         elif source.curr == "\\":
@@ -138,7 +217,8 @@ class TextParser:
 class FieldParser:
     """Parser for field (like number range)."""
 
-    def __init__(self):
+    def __init__(self, position=None):
+        self.position = position
         self.range_start = ExtractSeq()
         self.range_end = ExtractSeq()
         self.option = {}
@@ -189,7 +269,7 @@ class FieldParser:
     def _parse_start_of_option(self, source: Source):
         if source.curr.isnumeric():
             if "pad_len" in self.option:
-                lenght = self.option["pad_lenght"]
+                pad_len = self.option["pad_len"]
             else:
                 pad_len = ExtractSeq()
                 self.option["pad_len"] = pad_len
@@ -220,8 +300,13 @@ class FieldParser:
         return self._parser_state(source)
 
     def build(self):
-        start = self.range_start.int()
-        end = self.range_end.int()
+        try:
+            start = self.range_start.int()
+            end = self.range_end.int()
+        except ValueError:
+            raise PatternError("invalid number in field", self.position) from None
+        if start > end:
+            raise PatternError("start of field greater than its end", self.position)
         pad_len = None
         if self.option.get("pad_field", False):
             if "pad_len" in self.option:
@@ -239,7 +324,7 @@ def find_parser(source: Source):
         source.enable_escaping()
         return TextParser()
     elif source.curr == "[":
-        f = FieldParser()
+        f = FieldParser(source.position)
         f.put_error_if_left(source)
         return f
     elif source.curr == "]":
@@ -248,3 +333,104 @@ def find_parser(source: Source):
         p = TextParser()
         return p.parse(source)
 
+
+
+CacheInfo = collections.namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class PatternCache:
+    """Bounded LRU cache of compiled patterns, by expression."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.patterns = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, expression):
+        with self.lock:
+            pattern = self.patterns.get(expression)
+            if pattern is not None:
+                self.patterns.move_to_end(expression)
+                self.hits += 1
+                return pattern
+            self.misses += 1
+
+        pattern = Source(expression).parse_and_compile()
+        with self.lock:
+            self.patterns[expression] = pattern
+            self.patterns.move_to_end(expression)
+            self._evict()
+        return pattern
+
+    def resize(self, maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.patterns.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self.patterns))
+
+    def _evict(self):
+        while len(self.patterns) > self.maxsize:
+            self.patterns.popitem(last=False)
+
+
+_cache = PatternCache()
+
+
+def compile(expression):
+    """Return the compiled pattern of the expression, from cache if possible."""
+    return _cache.get(expression)
+
+
+def set_cache_size(maxsize):
+    _cache.resize(maxsize)
+
+
+def cache_info():
+    return _cache.info()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+ValidationResult = collections.namedtuple(
+    "ValidationResult", "expression error position count min_length max_length")
+
+
+def validate(expression):
+    """Return the validation result of an expression.
+
+    An invalid expression gives its error and the offset of the faulty
+    character, if known; a valid one gives its count of identifiers and
+    their length.
+    """
+    try:
+        fields = Source(expression).parse_and_build()
+    except PatternError as e:
+        return ValidationResult(expression, e.message, e.position, None, None, None)
+    # no pattern is compiled: its formatter and tables would go unused
+    widths = [f.widths for f in fields]
+    return ValidationResult(expression, None, None, generator.combinatory_space(fields),
+                            sum(min(w) for w in widths), sum(max(w) for w in widths))
+
+
+def validate_many(expressions, jobs=1, chunk_size=256):
+    """Return the validation results of expressions, in order.
+
+    With several jobs, expressions are validated by a pool of processes.
+    """
+    if jobs > 1:
+        import multiprocessing
+        with multiprocessing.Pool(jobs) as pool:
+            return pool.map(validate, expressions, chunk_size)
+    return [validate(expression) for expression in expressions]
@@ -1,6 +1,58 @@
 
-import random
 import functools
+import itertools
+import logging
+import sys
+
+import dedupe
+import engine as engines
+import permutation
+import telemetry
+
+
+# ranks must fit in numpy int64 arrays
+NUMPY_MAX_SPACE = 2**63
+# smallest batch drawn with NumPy: below, its per call overhead makes it slower
+NUMPY_MIN_BATCH = 1024
+
+# share of the space past which a Bloom filter is not used: once the
+# space is nearly full, false positives would make draws retry forever
+BLOOM_MAX_SHARE = 0.5
+
+# widest share of an ambiguous pattern whose distinct identifiers are
+# counted, to stop the draws once they are all produced
+AMBIGUOUS_MAX_COUNT = 2**18
+
+# fields up to this count get a table of their formatted values
+TABLE_MAX_COUNT = 10**5
+# memory shared by all tables, in bytes
+TABLE_BUDGET = 64 * 2**20
+
+_tables = {}
+_tables_size = 0
+
+
+def string_table(start, end, fixed_length):
+    """Return the formatted values of a range field, or None.
+
+    Tables are built on first use, shared by all fields of the same range
+    and padding, and not built for wide fields nor past the memory budget.
+    """
+    global _tables_size
+    key = (start, end, fixed_length)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    count = end - start + 1
+    # approximate size of a short str object, plus its pointer in the tuple
+    size = count * (sys.getsizeof("") + max(len(str(end)), fixed_length) + 8)
+    if count > TABLE_MAX_COUNT or _tables_size + size > TABLE_BUDGET:
+        return None
+    table = tuple(str(value).zfill(fixed_length) for value in range(start, end + 1))
+    _tables[key] = table
+    _tables_size += size
+    return table
 
 
 class FixGenerator:
@@ -8,12 +60,20 @@ class FixGenerator:
         self.content = content
         self.count = 1
 
-    def __iter__(self):
-        return self
-
-    def __next__(self):
+    def at(self, index):
         return self.content
 
+    @property
+    def widths(self):
+        return (len(self.content),)
+
+    def index(self, text):
+        return 0 if text == self.content else None
+
+    @property
+    def template(self):
+        return self.content.replace("%", "%%")
+
 
 class RangeGenerator:
     def __init__(self, start, end, fixed_length):
@@ -22,23 +82,284 @@ class RangeGenerator:
         assert self.start <= self.end
         self.fixed_length = int(fixed_length) if fixed_length else 0
         self.count = self.end - self.start + 1
+        self.table = None
 
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        value = str(random.randint(self.start, self.end))
+    def at(self, index):
+        if self.table is None:
+            self.table = string_table(self.start, self.end, self.fixed_length) or ()
+        if self.table:
+            return self.table[index]
+        value = str(self.start + index)
         if self.fixed_length:
             value = value.zfill(self.fixed_length)
         return value
 
+    @property
+    def widths(self):
+        shortest = max(len(str(self.start)), self.fixed_length)
+        longest = max(len(str(self.end)), self.fixed_length)
+        return tuple(range(longest, shortest - 1, -1))
+
+    def index(self, text):
+        try:
+            value = int(text)
+        except ValueError:
+            return None
+        if not self.start <= value <= self.end:
+            return None
+        index = value - self.start
+        return index if self.at(index) == text else None
+
+    @property
+    def template(self):
+        return "%0{}d".format(self.fixed_length) if self.fixed_length else "%d"
+
+
+def combinatory_space(fields):
+    return functools.reduce(lambda x,y: x*y, (f.count for f in fields), 1)
+
+
+def fold_fields(fields):
+    """Merge adjacent constant fields (literals and single value ranges)."""
+    folded = []
+    for f in fields:
+        if f.count != 1:
+            folded.append(f)
+        elif folded and isinstance(folded[-1], FixGenerator):
+            folded[-1] = FixGenerator(folded[-1].content + f.at(0))
+        else:
+            folded.append(FixGenerator(f.at(0)))
+    return tuple(f for f in folded if f.count != 1 or f.content)
+
+
+def compile_formatter(fields):
+    """Return a function formatting the identifier of a rank in one call.
+
+    The function body is generated for the fields: ranges are split out of
+    the rank from the last one, then formatted with literals inlined. Small
+    ranges are looked up in their string table, runs of the other fields
+    are formatted by a %-template.
+    """
+    ranges = [f for f in fields if f.count != 1]
+    lines = ["def format_rank(index):"]
+    for i in range(len(ranges) - 1, 0, -1):
+        lines.append("    index, d{} = divmod(index, {})".format(i, ranges[i].count))
+
+    namespace = {}
+    parts = []
+    run = []
+    values = []
+
+    def end_run():
+        if values:
+            parts.append("{!r} % ({},)".format("".join(f.template for f in run), ", ".join(values)))
+        elif run:
+            parts.append(repr("".join(f.content for f in run)))
+        del run[:], values[:]
+
+    for f in fields:
+        if f.count == 1:
+            run.append(f)
+            continue
+        i = ranges.index(f)
+        digit = "d{}".format(i) if i else "index"
+        table = string_table(f.start, f.end, f.fixed_length)
+        if table is None:
+            run.append(f)
+            values.append("{} + {}".format(f.start, digit))
+        else:
+            end_run()
+            namespace["t{}".format(i)] = table
+            parts.append("t{}[{}]".format(i, digit))
+    end_run()
+
+    lines.append("    return \"\".join(({}))".format("".join(p + ", " for p in parts)))
+    exec("\n".join(lines), namespace)
+    return namespace["format_rank"]
+
+
+class Pattern:
+    """Compiled pattern, seen as a mixed-radix number over its fields.
+
+    The first field is the most significant digit, so identifiers are ranked
+    in lexicographic field order. Constant fields are folded together and
+    identifiers are formatted by a function compiled for the fields.
+
+    A pattern is immutable, so it can be shared once compiled.
+    """
+
+    __slots__ = ("expression", "fields", "count", "template", "format_rank")
+
+    def __init__(self, fields, expression=None):
+        fields = fold_fields(fields)
+        set_ = super().__setattr__
+        set_("expression", expression)
+        set_("fields", fields)
+        set_("count", combinatory_space(fields))
+        set_("template", "".join(f.template for f in fields))
+        set_("format_rank", compile_formatter(fields))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("pattern is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("pattern is immutable")
+
+    def __reduce__(self):
+        return (Pattern, (self.fields, self.expression))
+
+    def nth(self, index):
+        """Return the identifier of the given rank."""
+        if not 0 <= index < self.count:
+            raise IndexError("rank {} out of pattern range".format(index))
+        return self.format_rank(index)
+
+    def digits(self, rank):
+        """Return the index of each field value in the identifier of a rank."""
+        digits = []
+        for f in reversed(self.fields):
+            rank, digit = divmod(rank, f.count)
+            digits.append(digit)
+        return tuple(reversed(digits))
+
+    @property
+    def ambiguous(self):
+        """Whether several ranks may give the same identifier.
+
+        It is the case when a field of varying width is followed by a field
+        that may start with a digit, like "[1-50][1-40]" where "111" is
+        both (1, 11) and (11, 1). Identifiers are then ranked by their
+        widest parse.
+        """
+        for f, following in zip(self.fields, self.fields[1:]):
+            if len(f.widths) > 1 and following.at(0)[:1].isdigit():
+                return True
+        return False
+
+    def rank(self, identifier):
+        """Return the rank of the given identifier."""
+        rank = self._rank(identifier, 0, 0, 0, set())
+        if rank is None:
+            raise ValueError("'{}' does not match the pattern".format(identifier))
+        return rank
+
+    def _rank(self, identifier, position, field_index, rank, failed):
+        # the rest of the identifier cannot match the rest of the fields
+        # whatever the rank so far: each failure is only searched once
+        if (position, field_index) in failed:
+            return None
+        if field_index == len(self.fields):
+            return rank if position == len(identifier) else None
+        field = self.fields[field_index]
+        for width in field.widths:
+            digit = field.index(identifier[position:position + width])
+            if digit is None:
+                continue
+            found = self._rank(identifier, position + width, field_index + 1,
+                               rank * field.count + digit, failed)
+            if found is not None:
+                return found
+        failed.add((position, field_index))
+        return None
+
+
+class Partition:
+    """Share of a pattern space owned by one node among `node_count`.
+
+    Node K owns the positions K, K + M, K + 2M... of the space, so shares of
+    nodes are disjoint. When a permutation is given (the same on all nodes),
+    positions are mapped through it, spreading each share over the space.
+    """
+
+    def __init__(self, space, node_id=0, node_count=1, permutation=None):
+        if not 0 <= node_id < node_count:
+            raise ValueError("node id must be in [0, {}[".format(node_count))
+        self.node_id = node_id
+        self.node_count = node_count
+        self.permutation = permutation
+        self.count = max(0, space - node_id + node_count - 1) // node_count
+
+    def rank(self, index):
+        """Return the pattern rank of the given index of the share."""
+        position = self.node_id + index * self.node_count
+        if self.permutation is None:
+            return position
+        return self.permutation(position)
+
 
 class IdentifierGenerator:
-    def __init__(self, fields, limit):
-        self.fields = tuple(iter(f) for f in fields)
-        combinatory_limit = functools.reduce(lambda x,y: x*y, (f.count for f in fields), 1)
-        self.limit = min(limit, combinatory_limit)
-        self.produced = set()
+    """Generator of unique random identifiers.
+
+    Produced identifiers are remembered by rank. With an `error_rate`, they
+    are remembered in a Bloom filter of fixed size instead, which is meant for
+    spaces far wider than the limit: a false positive costs a retry, so
+    filling most of the space would retry forever. The exact store is kept
+    for small spaces and for limits over `BLOOM_MAX_SHARE` of the space.
+
+    With several nodes, only the share of `node_id` is drawn from. It is
+    strided over the space, or spread by a permutation keyed by `seed`.
+
+    When the pattern is ambiguous, an identifier is remembered by the rank
+    it is parsed back to, because several ranks can give it.
+
+    With a registry, produced identifiers are remembered in it instead, so
+    identifiers issued by previous runs are not produced again.
+
+    Draws come from the generator own engine, a `engine.RandomEngine`
+    seeded with `seed` unless another one is given.
+
+    Attempts, collisions and time spent are recorded in `stats`, which
+    warns when the space gets nearly exhausted.
+    """
+
+    def __init__(self, fields, limit, error_rate=None, node_id=0, node_count=1, seed=None,
+                 registry=None, engine=None):
+        self.pattern = Pattern(fields)
+        perm = None
+        if node_count > 1 and seed is not None:
+            perm = permutation.FeistelPermutation(self.pattern.count, seed)
+        self.partition = Partition(self.pattern.count, node_id, node_count, perm)
+        combinatory_limit = self.partition.count
+        self.canonical = self.pattern.ambiguous
+        distinct = combinatory_limit
+        if self.canonical and self.partition.count <= AMBIGUOUS_MAX_COUNT:
+            # fewer identifiers than ranks: draws past them would retry forever
+            distinct = self.distinct_count()
+        self.limit = min(limit, distinct)
+        self.by_rank = registry is not None
+        if registry is not None:
+            if node_count > 1:
+                # the registry does not tell how much of the share is left
+                raise ValueError("random draws cannot share a registry between nodes")
+            self.limit = min(self.limit, distinct - len(registry))
+            self.produced = registry
+        elif error_rate is not None and self.bloom_fits(combinatory_limit):
+            self.produced = dedupe.BloomFilter(self.limit, error_rate)
+        elif self.canonical:
+            self.produced = dedupe.AdaptiveStore(self.pattern.count)
+        else:
+            self.produced = dedupe.AdaptiveStore(combinatory_limit)
+        self.engine = engine if engine is not None else engines.RandomEngine(seed)
+        self.stats = self.make_stats()
+
+    def distinct_count(self):
+        """Return the number of distinct identifiers of the share."""
+        nth, rank = self.pattern.nth, self.partition.rank
+        return len(set(nth(rank(index)) for index in range(self.partition.count)))
+
+    def bloom_fits(self, space):
+        """Whether a Bloom filter can remember the identifiers of the space."""
+        if space > dedupe.SMALL_SPACE and self.limit <= space * BLOOM_MAX_SHARE:
+            return True
+        logging.getLogger("generator").info(
+            "%s identifiers out of %s are remembered exactly, despite the error rate",
+            self.limit, space)
+        return False
+
+    def make_stats(self, callback=None, every=100000):
+        """Return statistics for this generator, from its current fill."""
+        space = self.pattern.count if self.canonical or self.by_rank else self.partition.count
+        return telemetry.GenerationStats(space, len(self.produced), callback, every)
 
     def __iter__(self):
         return self
@@ -47,13 +368,287 @@ class IdentifierGenerator:
         if self.limit <= 0:
             raise StopIteration()
 
+        attempts = 1
         newest = self._generate()
-        while newest in self.produced:
+        while not self.produced.insert(self._key(newest)):
+            attempts += 1
             newest = self._generate()
 
         self.limit -= 1
-        self.produced.add(newest)
-        return newest
+        self.stats.record(attempts)
+        return self.pattern.format_rank(self.partition.rank(newest))
 
     def _generate(self):
-        return "".join(next(f) for f in self.fields)
+        return self.engine.randbelow(self.partition.count)
+
+    def _key(self, index):
+        if self.canonical:
+            return self.pattern.rank(self.pattern.format_rank(self.partition.rank(index)))
+        if self.by_rank:
+            return self.partition.rank(index)
+        return index
+
+    def remaining(self):
+        """Return how many identifiers of the share were not produced yet."""
+        return self.partition.count - len(self.produced)
+
+    def getstate(self):
+        """Return the state to resume from, as a JSON-able dict and bytes."""
+        meta, payload = self.produced.dump()
+        return {"limit": self.limit, "produced": meta, "engine": self.engine.getstate()}, payload
+
+    def setstate(self, state, payload):
+        """Resume from a state of a generator built with the same arguments.
+
+        The engine goes on from its saved state, so that a seeded run does not
+        draw again the identifiers it produced before.
+        """
+        self.limit = state["limit"]
+        self.produced.restore(state["produced"], payload)
+        if state.get("engine") is not None:
+            self.engine.setstate(state["engine"])
+        self.stats.filled = len(self.produced)
+
+    def generate_batch(self, n):
+        """Return up to n new unique identifiers, drawn all at once.
+
+        NumPy arrays are used for batches of `NUMPY_MIN_BATCH` identifiers or
+        more, when NumPy is installed, the engine can seed a NumPy generator
+        and the pattern space fits in 64 bits, the standard library
+        otherwise.
+        """
+        return self._batch(n, True)
+
+    def generate_ranks(self, n):
+        """Return the ranks of up to n new unique identifiers, not formatted."""
+        return self._batch(n, False)
+
+    def _batch(self, n, formatted):
+        batch = []
+        wanted = min(n, self.limit)
+        use_numpy = (wanted >= NUMPY_MIN_BATCH and self.pattern.count <= NUMPY_MAX_SPACE
+                     and self.partition.node_count == 1 and not self.canonical
+                     and self.engine.numpy_generator() is not None)
+        while len(batch) < wanted:
+            draws = wanted - len(batch)
+            if use_numpy:
+                kept = self._draw_batch_numpy(draws, formatted)
+            else:
+                kept = self._draw_batch_python(draws, formatted)
+            self.stats.record_batch(draws, len(kept))
+            batch.extend(kept)
+        self.limit -= len(batch)
+        return batch
+
+
+    def _keep_new(self, indexes, n):
+        """Register and return the first n indexes not produced yet."""
+        kept = []
+        for index in indexes:
+            if self.produced.insert(self._key(index)):
+                kept.append(index)
+                if len(kept) == n:
+                    break
+        return kept
+
+    def _draw_batch_python(self, n, formatted=True):
+        with self.stats.timer("draw"):
+            indexes = dict.fromkeys(self._generate() for _ in range(n))
+        with self.stats.timer("dedupe"):
+            kept = self._keep_new(indexes, n)
+        if not formatted:
+            return [self.partition.rank(index) for index in kept]
+        with self.stats.timer("format"):
+            return [self.pattern.format_rank(self.partition.rank(index)) for index in kept]
+
+    def _draw_batch_numpy(self, n, formatted=True):
+        numpy = engines.import_numpy()
+        rng = self.engine.numpy_generator()
+        fields = self.pattern.fields
+        with self.stats.timer("draw"):
+            digits = numpy.stack([rng.integers(0, f.count, n) for f in fields])
+            ranks = numpy.zeros(n, dtype=numpy.int64)
+            for f, column in zip(fields, digits):
+                ranks = ranks * f.count + column
+        with self.stats.timer("dedupe"):
+            unique, first = numpy.unique(ranks, return_index=True)
+            if isinstance(self.produced, dedupe.AdaptiveStore):
+                missing = self.produced.insert_sorted(unique)
+            else:
+                missing = numpy.fromiter(map(self.produced.insert, unique.tolist()),
+                                         dtype=bool, count=len(unique))
+            # back to the order of the draws
+            keep = numpy.sort(first[missing])
+        if not len(keep):
+            return []
+        if not formatted:
+            return ranks[keep].tolist()
+        with self.stats.timer("format"):
+            ids = numpy.full(len(keep), "", dtype=str)
+            for f, column in zip(fields, digits):
+                if isinstance(f, RangeGenerator):
+                    text = (column[keep] + f.start).astype(str)
+                    if f.fixed_length:
+                        text = numpy.char.zfill(text, f.fixed_length)
+                else:
+                    text = f.content
+                ids = numpy.char.add(ids, text)
+            return ids.tolist()
+
+def warn_if_ambiguous(pattern):
+    if pattern.ambiguous:
+        logging.getLogger("generator").warning(
+                "ambiguous pattern, distinct ranks may give the same identifier")
+
+
+class PermutationIdentifierGenerator:
+    """Generator of unique identifiers without retries.
+
+    The pattern is read as a mixed-radix number, one digit per field in base
+    of the field count. A keyed permutation of its index space is walked in
+    order, and each index is decoded into the field values.
+
+    With several nodes, `node_id` only walks its share of the permutation;
+    all nodes must then use the same seed. With a registry, identifiers
+    already issued are skipped and the new ones recorded.
+    """
+
+    def __init__(self, fields, limit, seed=None, node_id=0, node_count=1, registry=None):
+        if node_count > 1 and seed is None:
+            raise ValueError("nodes must share a seed to share a permutation")
+        self.pattern = Pattern(fields)
+        warn_if_ambiguous(self.pattern)
+        self.permutation = permutation.FeistelPermutation(self.pattern.count, seed)
+        self.partition = Partition(self.pattern.count, node_id, node_count, self.permutation)
+        self.limit = min(limit, self.partition.count)
+        self.registry = registry
+        self.cursor = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.pattern.format_rank(self._next_rank())
+
+    def _next_rank(self):
+        if self.limit <= 0:
+            raise StopIteration()
+
+        index = self._walk()
+        while self.registry is not None and not self.registry.insert(index):
+            index = self._walk()
+        self.limit -= 1
+        return index
+
+    def _walk(self):
+        if self.cursor >= self.partition.count:
+            raise StopIteration()
+        index = self.partition.rank(self.cursor)
+        self.cursor += 1
+        return index
+
+    def remaining(self):
+        """Return how many identifiers of the share were not produced yet."""
+        return self.partition.count - self.cursor
+
+    def generate_batch(self, n):
+        return list(itertools.islice(self, n))
+
+    def generate_ranks(self, n):
+        """Return the ranks of up to n next identifiers, not formatted."""
+        return list(itertools.islice(iter(self._next_rank, None), n))
+
+    def getstate(self):
+        """Return the state to resume from, as a JSON-able dict and bytes."""
+        return {"limit": self.limit, "cursor": self.cursor}, b""
+
+    def setstate(self, state, payload):
+        """Resume from a state of a generator built with the same arguments."""
+        self.limit = state["limit"]
+        self.cursor = state["cursor"]
+
+
+class SequentialIdentifierGenerator:
+    """Generator of identifiers in lexicographic field order.
+
+    Fields are iterated as an odometer from the given rank: only the fields
+    that changed are formatted again, and nothing is remembered. With a
+    registry, identifiers already issued are skipped and the new ones
+    recorded.
+    """
+
+    def __init__(self, fields, limit, start=0, registry=None):
+        self.pattern = Pattern(fields)
+        warn_if_ambiguous(self.pattern)
+        if not 0 <= start <= self.pattern.count:
+            raise IndexError("start {} out of pattern range".format(start))
+        self.limit = min(limit, self.pattern.count - start)
+        self.registry = registry
+        self._seek(start)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.limit <= 0:
+            raise StopIteration()
+
+        newest = self._step()
+        while self.registry is not None and not self.registry.insert(self.position - 1):
+            newest = self._step()
+        self.limit -= 1
+        return newest
+
+    def _step(self):
+        if self.position >= self.pattern.count:
+            raise StopIteration()
+        newest = "".join(self.parts)
+        self.position += 1
+        if self.position < self.pattern.count:
+            self._increment()
+        return newest
+
+    def generate_batch(self, n):
+        return list(itertools.islice(self, n))
+
+    def generate_ranks(self, n):
+        """Return the ranks of up to n next identifiers, not formatted."""
+        ranks = []
+        wanted = min(n, self.limit)
+        position = self.position
+        while len(ranks) < wanted and position < self.pattern.count:
+            if self.registry is None or self.registry.insert(position):
+                ranks.append(position)
+            position += 1
+        self.limit -= len(ranks)
+        self._seek(position)
+        return ranks
+
+    def getstate(self):
+        """Return the state to resume from, as a JSON-able dict and bytes."""
+        return {"limit": self.limit, "position": self.position}, b""
+
+    def setstate(self, state, payload):
+        """Resume from a state of a generator built with the same arguments."""
+        self.limit = state["limit"]
+        self._seek(state["position"])
+
+    def _seek(self, position):
+        self.position = position
+        self.digits = []
+        for f in reversed(self.pattern.fields):
+            position, digit = divmod(position, f.count)
+            self.digits.append(digit)
+        self.digits.reverse()
+        self.parts = [f.at(d) for f, d in zip(self.pattern.fields, self.digits)]
+
+    def _increment(self):
+        fields = self.pattern.fields
+        for i in range(len(fields) - 1, -1, -1):
+            digit = self.digits[i] + 1
+            if digit < fields[i].count:
+                self.digits[i] = digit
+                self.parts[i] = fields[i].at(digit)
+                return
+            self.digits[i] = 0
+            self.parts[i] = fields[i].at(0)
@@ -1,18 +1,162 @@
 
 import argparse
+import json
+import os
+import random
+import signal
+import sys
 
+import checkpoint
+import engine
 import exprparse
 import generator
+import output
+import registry
 
 
+BATCH_SIZE = 65536
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
             description="Generator of identifier"
             )
-    parser.add_argument("-c", "--count", type=int, help="Number of identifier generated")
-    parser.add_argument("pattern", type=str, help="Identifier format")
-    return parser.parse_args()
+    parser.add_argument("-c", "--count", type=int,
+                        help="Number of identifier generated, 0 for as many as the pattern can")
+    parser.add_argument("--stream", action="store_true",
+                        help="Produce identifiers until the reader closes the output or the pattern is exhausted,"
+                             " walking a permutation unless --sequential")
+    parser.add_argument("-p", "--permutation", action="store_true",
+                        help="Walk a keyed permutation of the pattern space (no retries)")
+    parser.add_argument("-e", "--error-rate", type=float,
+                        help="Remember produced identifiers in a Bloom filter of this false positive rate")
+    parser.add_argument("-s", "--sequential", action="store_true",
+                        help="Enumerate identifiers in order instead of randomly")
+    parser.add_argument("--start", type=int, default=0,
+                        help="Rank of the first identifier, with --sequential")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of worker processes, sharing a keyed permutation of the pattern space")
+    parser.add_argument("--seed", type=int,
+                        help="Seed of the random engine and key of the permutation, to be shared by all nodes")
+    parser.add_argument("--engine", choices=sorted(engine.ENGINES), default="random",
+                        help="Source of randomness of random draws")
+    parser.add_argument("--node-id", type=int, default=0,
+                        help="Index of this node, in [0, node count[")
+    parser.add_argument("--node-count", type=int, default=1,
+                        help="Number of nodes sharing the pattern space")
+    parser.add_argument("--checkpoint", metavar="FILE",
+                        help="Save the generation state to this file, to be resumed")
+    parser.add_argument("--checkpoint-every", type=int, default=100000,
+                        help="Number of identifier between two checkpoints")
+    parser.add_argument("--resume", metavar="FILE",
+                        help="Resume the run saved in this checkpoint file")
+    parser.add_argument("--registry", metavar="FILE",
+                        help="Registry of the identifiers issued by all runs, never produced again")
+    parser.add_argument("--import-legacy", metavar="FILE",
+                        help="Add the identifiers of this file (one per line) to the registry, then exit")
+    parser.add_argument("--serve", action="store_true",
+                        help="Serve identifiers of any pattern to local clients, until interrupted")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="Unix socket to serve on, instead of a localhost TCP port")
+    parser.add_argument("--port", type=int, default=7070,
+                        help="Localhost TCP port to serve on")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="Write identifiers to this file instead of the standard output")
+    parser.add_argument("--format", choices=sorted(output.FORMATS), default="newline",
+                        help="Output format: identifiers separated by newlines or NUL, NDJSON or CSV with"
+                             " field values, or binary uint64 ranks after a header")
+    parser.add_argument("--buffer-size", type=int, default=output.BUFFER_SIZE,
+                        help="Number of bytes gathered before each write")
+    parser.add_argument("-a", "--auto", action="store_true",
+                        help="Choose the generation strategy from the count, the pattern space and the memory")
+    parser.add_argument("--explain", action="store_true",
+                        help="Print the strategy --auto would choose, with its estimated memory and time, then exit")
+    parser.add_argument("--stats", action="store_true",
+                        help="Print statistics of random draws to the standard error at exit")
+    parser.add_argument("--check", metavar="FILE",
+                        help="Validate the patterns of this file (one per line), print a JSON result for each, then exit")
+    parser.add_argument("pattern", type=str, nargs="?", help="Identifier format")
+    args = parser.parse_args()
+    if args.pattern is None and args.resume is None and not args.serve and not args.check:
+        parser.error("the pattern is required")
+    if args.engine == "secrets" and args.seed is not None:
+        parser.error("the secrets engine cannot be seeded")
+    if args.import_legacy and not args.registry:
+        parser.error("--import-legacy requires --registry")
+    if args.registry and args.jobs > 1:
+        parser.error("--registry cannot be used with --jobs")
+    if args.registry and args.serve:
+        # a registry records the identifiers of a single pattern
+        parser.error("--registry cannot be used with --serve")
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    if args.serve and args.jobs > 1:
+        # requests are answered in the event loop, not by worker processes
+        parser.error("--jobs cannot be used with --serve")
+    if args.auto and (args.permutation or args.sequential or args.jobs > 1
+                      or args.error_rate is not None or args.stream or args.count == 0):
+        parser.error("--auto chooses the strategy itself")
+    if args.stream and args.count:
+        parser.error("--stream produces identifiers without count, use --count 0 or --stream alone")
+    if args.count == 0:
+        args.stream = True
+    if args.stream and args.error_rate is not None:
+        parser.error("streams walk the pattern, they remember nothing to give an error rate to")
+    if args.stream and not args.sequential:
+        # a walk remembers nothing, whatever the number of identifiers
+        args.permutation = True
+    if args.node_count < 1:
+        parser.error("--node-count must be at least 1")
+    if not 0 <= args.node_id < args.node_count:
+        parser.error("--node-id must be in [0, {}[".format(args.node_count))
+    if args.node_count > 1 and args.seed is None and (args.permutation or args.jobs > 1 or args.auto):
+        parser.error("nodes must share a --seed to share a permutation")
+    if args.registry and args.node_count > 1 and not (args.permutation or args.sequential):
+        parser.error("--registry with --node-count requires --permutation or --sequential")
+    if args.stats and (args.permutation or args.sequential or args.jobs > 1):
+        parser.error("--stats only applies to random draws")
+    if args.start and args.pattern is not None:
+        try:
+            space = generator.combinatory_space(exprparse.Source(args.pattern).parse_and_build())
+        except exprparse.PatternError:
+            # reported once the pattern is parsed
+            space = None
+        if space is not None and not 0 <= args.start <= space:
+            parser.error("--start must be in [0, {}]".format(space))
+    return args
+
+
+def make_plan(args, fields):
+    import planner
+    space = generator.Partition(generator.combinatory_space(fields), args.node_id, args.node_count).count
+    limit = space if args.stream else int(args.count if args.count else 20)
+    return planner.plan(space, limit)
+
+
+def make_generator(args, fields, issued=None):
+    if args.stream:
+        limit = generator.combinatory_space(fields)
+    else:
+        limit = int(args.count if args.count else 20)
+    # imported when used, to start quickly
+    if args.auto:
+        import planner
+        strategy = getattr(args, "strategy", None) or make_plan(args, fields).strategy
+        return planner.build(strategy, fields, limit, args.seed, args.node_id, args.node_count,
+                             issued, engine.make(args.engine, args.seed))
+    elif args.sequential:
+        return generator.SequentialIdentifierGenerator(fields, limit, args.start, issued)
+    elif args.jobs > 1:
+        import parallel
+        return parallel.ParallelIdentifierGenerator(fields, limit, args.jobs, args.seed,
+                                                    args.node_id, args.node_count)
+    elif args.permutation:
+        return generator.PermutationIdentifierGenerator(fields, limit, args.seed,
+                                                        args.node_id, args.node_count, issued)
+    else:
+        return generator.IdentifierGenerator(fields, limit, args.error_rate,
+                                             args.node_id, args.node_count, args.seed, issued,
+                                             engine.make(args.engine, args.seed))
 
 
 if __name__ == "__main__":
@@ -23,9 +167,98 @@ if __name__ == "__main__":
         logging.config.fileConfig("log_conf.ini")
 
     args = parse_args()
-    parser = exprparse.Source(args.pattern)
-    fields = parser.parse_and_build()
-    limit = int(args.count if args.count else 20)
-    for id_ in generator.IdentifierGenerator(fields, limit):
-        print(id_)
+    if args.serve:
+        import server
+
+        def make_server_generator(pattern):
+            pattern_args = argparse.Namespace(**dict(vars(args), count=pattern.count))
+            return make_generator(pattern_args, pattern.fields)
+        server.serve(args.socket, "127.0.0.1", args.port, make_server_generator)
+        sys.exit(0)
+
+    if args.check:
+        with open(args.check) as f:
+            expressions = [line.rstrip("\r\n") for line in f if line.strip()]
+        results = exprparse.validate_many(expressions, args.jobs)
+        for result in results:
+            print(json.dumps(result._asdict()))
+        sys.exit(1 if any(result.error for result in results) else 0)
+
+    state = None
+    if args.resume:
+        state, payload = checkpoint.load(args.resume)
+        saved = dict(state["args"],
+                     checkpoint=args.checkpoint or args.resume,
+                     checkpoint_every=args.checkpoint_every,
+                     output=args.output,
+                     buffer_size=args.buffer_size)
+        args = argparse.Namespace(**saved)
+    elif args.seed is None and args.node_count == 1 and (args.permutation or args.jobs > 1 or args.auto):
+        # the permutation must be the same when resuming
+        args.seed = random.getrandbits(64)
+
+    if args.stats:
+        # also show when the space gets nearly exhausted, as it happens
+        logging.basicConfig(format="%(message)s")
+    elif not os.path.exists("log_conf.ini"):
+        # warnings about the fill of the space belong to the statistics
+        logging.getLogger("telemetry").setLevel(logging.ERROR)
+
+    try:
+        fields = exprparse.Source(args.pattern).parse_and_build()
+    except exprparse.PatternError as e:
+        print("invalid pattern, {}".format(e), file=sys.stderr)
+        sys.exit(1)
+
+    if args.explain:
+        print(make_plan(args, fields).explain())
+        sys.exit(0)
+    if args.auto and not getattr(args, "strategy", None):
+        # kept in checkpoints, so a resumed run follows the same plan
+        args.strategy = make_plan(args, fields).strategy
+
+    issued = None
+    if args.registry:
+        issued = registry.Registry(args.registry, args.pattern, generator.Pattern(fields))
+    if args.import_legacy:
+        with open(args.import_legacy) as legacy:
+            imported = issued.import_identifiers(legacy)
+        issued.close()
+        print("{} identifiers imported".format(imported), file=sys.stderr)
+        sys.exit(0)
+
+    gen = make_generator(args, fields, issued)
+    if state:
+        gen.setstate(state["generator"], payload)
+
+    if args.output:
+        # a resumed run continues the output of the interrupted one
+        mode = os.O_APPEND if state else os.O_TRUNC
+        out_fd = os.open(args.output, os.O_WRONLY | os.O_CREAT | mode, 0o644)
+    else:
+        out_fd = sys.stdout.fileno()
+    writer = output.Writer(out_fd, args.buffer_size, args.format,
+                           generator.Pattern(fields, args.pattern), header=not state)
 
+    block_size = args.checkpoint_every if args.checkpoint else BATCH_SIZE
+    try:
+        generate = gen.generate_ranks if writer.by_rank else gen.generate_batch
+        for block in iter(lambda: generate(block_size), []):
+            if args.checkpoint:
+                # saved before writing: a crash may lose identifiers, never repeat them
+                writer.flush()
+                gen_state, gen_payload = gen.getstate()
+                checkpoint.save(args.checkpoint, {"args": vars(args), "generator": gen_state},
+                                gen_payload)
+            writer.write(block)
+        writer.flush()
+    except BrokenPipeError:
+        # the reader is gone, like `head`: stop quietly, as on SIGPIPE
+        sys.exit(128 + signal.SIGPIPE)
+    finally:
+        if args.stats and getattr(gen, "stats", None) is not None:
+            print(gen.stats.report(), file=sys.stderr)
+        if args.output:
+            os.close(out_fd)
+        if issued is not None:
+            issued.close()
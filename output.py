@@ -0,0 +1,145 @@
+
+import array
+import csv
+import io
+import json
+import os
+import struct
+import sys
+
+import generator
+
+
+BUFFER_SIZE = 1 << 20
+
+BINARY_MAGIC = b"IDGENRK1"
+# magic, pattern space, length of the expression, followed by the expression
+# and padded to 8 bytes, so that ranks can be mapped as an array of uint64
+BINARY_HEADER = struct.Struct("<8sQI")
+
+
+def _encode_newline(pattern, ids):
+    return ("\n".join(ids) + "\n").encode("utf-8")
+
+
+def _encode_nul(pattern, ids):
+    return ("\0".join(ids) + "\0").encode("utf-8")
+
+
+def _encode_ndjson(pattern, ranks):
+    format_rank = pattern.format_rank
+    return "".join(json.dumps({"id": format_rank(rank), "fields": field_values(pattern, rank)})
+                   + "\n" for rank in ranks).encode("utf-8")
+
+
+def _encode_csv(pattern, ranks):
+    text = io.StringIO()
+    rows = csv.writer(text, lineterminator="\n")
+    format_rank = pattern.format_rank
+    rows.writerows([format_rank(rank)] + field_values(pattern, rank) for rank in ranks)
+    return text.getvalue().encode("utf-8")
+
+
+def _encode_binary(pattern, ranks):
+    ranks = array.array("Q", ranks)
+    if sys.byteorder == "big":
+        ranks.byteswap()
+    return ranks.tobytes()
+
+
+def _csv_header(pattern):
+    text = io.StringIO()
+    ranges = sum(isinstance(f, generator.RangeGenerator) for f in pattern.fields)
+    fields = ["field{}".format(i) for i in range(1, ranges + 1)]
+    csv.writer(text, lineterminator="\n").writerow(["id"] + fields)
+    return text.getvalue().encode("utf-8")
+
+
+def _binary_header(pattern):
+    if pattern.count > 2**64:
+        raise ValueError("pattern space is too wide for 64 bits ranks ({} identifiers)"
+                         .format(pattern.count))
+    key = (pattern.expression or "").encode("utf-8")
+    header = BINARY_HEADER.pack(BINARY_MAGIC, pattern.count, len(key)) + key
+    return header + b"\0" * (-len(header) % 8)
+
+
+# name: (encoder of a block, encoder of the file header, whether blocks
+# are made of ranks rather than identifiers)
+FORMATS = {
+    "newline": (_encode_newline, None, False),
+    "nul": (_encode_nul, None, False),
+    "ndjson": (_encode_ndjson, None, True),
+    "csv": (_encode_csv, _csv_header, True),
+    "binary": (_encode_binary, _binary_header, True),
+}
+
+
+def field_values(pattern, rank):
+    """Return the values of the range fields of the identifier of a rank."""
+    digits = pattern.digits(rank)
+    return [f.start + digit for f, digit in zip(pattern.fields, digits)
+            if isinstance(f, generator.RangeGenerator)]
+
+
+def read_ranks(data):
+    """Return the expression, space and ranks of a binary output.
+
+    `data` is any bytes-like object, like a memory-mapped file; ranks are
+    a view on it.
+    """
+    magic, space, key_size = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("not a binary identifier output")
+    begin = BINARY_HEADER.size + key_size
+    expression = bytes(data[BINARY_HEADER.size:begin]).decode("utf-8")
+    begin += -begin % 8
+    ranks = memoryview(data)[begin:].cast("Q")
+    return expression, space, ranks
+
+
+class Writer:
+    """Writer of identifiers to a file descriptor, by large chunks.
+
+    Identifiers are encoded a block at a time, in one of the `FORMATS`
+    of the given pattern, and gathered until `buffer_size` bytes are
+    pending, then written with as few system calls as possible. Blocks
+    are lists of identifiers, or of their ranks when `by_rank` is set by
+    the format, so that fields are not parsed back from the strings. A closed
+    pipe raises BrokenPipeError from `write()` or `flush()`. The header of
+    the format, if any, is written first unless `header` is false, as when
+    appending to an existing output.
+    """
+
+    def __init__(self, fd, buffer_size=BUFFER_SIZE, format_="newline", pattern=None, header=True):
+        try:
+            self.encode, encode_header, self.by_rank = FORMATS[format_]
+        except KeyError:
+            raise ValueError("unknown output format '{}'".format(format_)) from None
+        self.fd = fd
+        self.buffer_size = buffer_size
+        self.pattern = pattern
+        self.chunks = []
+        self.pending = 0
+        if header and encode_header is not None:
+            self._append(encode_header(pattern))
+
+    def write(self, block):
+        """Write a block of identifiers, or of ranks if `by_rank`."""
+        if not block:
+            return
+        self._append(self.encode(self.pattern, block))
+        if self.pending >= self.buffer_size:
+            self.flush()
+
+    def _append(self, chunk):
+        self.chunks.append(chunk)
+        self.pending += len(chunk)
+
+    def flush(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.pending = 0
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
@@ -0,0 +1,188 @@
+
+import collections
+import itertools
+import multiprocessing
+import random
+import threading
+
+import generator
+import permutation
+
+
+CHUNK_SIZE = 65536
+BLOCK_SIZE = 1024
+
+
+def generate(fields, limit, jobs, seed=None, node_id=0, node_count=1,
+             chunk_size=CHUNK_SIZE, start=0, ranks=False):
+    """Yield unique identifiers produced by a pool of worker processes.
+
+    Every worker walks the same keyed permutation of the pattern space, and
+    each one is handed disjoint chunks of its cursor positions, so no two
+    workers can produce the same identifier. Chunks are yielded in order.
+    With several nodes, only the share of `node_id` is walked. The walk
+    begins at the cursor position `start`. With `ranks`, the ranks of the
+    identifiers are yielded instead.
+    """
+    if seed is None:
+        if node_count > 1:
+            raise ValueError("nodes must share a seed to share a permutation")
+        seed = random.getrandbits(64)
+    pattern = generator.Pattern(fields)
+    end = min(start + limit, generator.Partition(pattern.count, node_id, node_count).count)
+    chunks = ((begin, min(begin + chunk_size, end))
+              for begin in range(start, end, chunk_size))
+
+    with multiprocessing.Pool(jobs, _init_worker,
+                              (pattern, seed, node_id, node_count, ranks)) as pool:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_generate_chunk, chunk))
+            # keep a bounded amount of chunks in flight
+            if len(pending) >= 2 * jobs:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+class ParallelIdentifierGenerator:
+    """Resumable iterator over the identifiers of `generate()`.
+
+    The seed is required: a resumed walk must follow the same permutation.
+    """
+
+    def __init__(self, fields, limit, jobs, seed, node_id=0, node_count=1,
+                 chunk_size=CHUNK_SIZE):
+        if seed is None:
+            raise ValueError("a seed is required to resume the same permutation")
+        self.fields = tuple(fields)
+        generator.warn_if_ambiguous(generator.Pattern(self.fields))
+        self.args = (jobs, seed, node_id, node_count, chunk_size)
+        self.limit = limit
+        self.cursor = 0
+        self.stream = None
+        self.ranks = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._next(False)
+
+    def _next(self, ranks):
+        if self.stream is None or self.ranks != ranks:
+            if self.stream is not None:
+                self.stream.close()
+            self.stream = generate(self.fields, self.limit, *self.args, start=self.cursor,
+                                   ranks=ranks)
+            self.ranks = ranks
+        newest = next(self.stream)
+        self.cursor += 1
+        self.limit -= 1
+        return newest
+
+    def generate_batch(self, n):
+        return list(itertools.islice(self, n))
+
+    def generate_ranks(self, n):
+        """Return the ranks of up to n next identifiers, not formatted."""
+        return list(itertools.islice(iter(lambda: self._next(True), None), n))
+
+    def getstate(self):
+        """Return the state to resume from, as a JSON-able dict and bytes."""
+        return {"limit": self.limit, "cursor": self.cursor}, b""
+
+    def setstate(self, state, payload):
+        """Resume from a state of a generator built with the same arguments."""
+        self.limit = state["limit"]
+        self.cursor = state["cursor"]
+        self.stream = None
+
+
+class ThreadSafeIdentifierGenerator:
+    """Generator of unique identifiers, to be shared by threads.
+
+    All threads walk the same keyed permutation of the pattern space. Each
+    one reserves a block of cursor positions, with its quota of the limit,
+    under a lock taken once per block, then formats the identifiers of the
+    block on its own. Blocks are disjoint, so no identifier is produced
+    twice. Positions reserved by a thread and not used yet are skipped when
+    resuming from a state.
+    """
+
+    def __init__(self, fields, limit, seed=None, node_id=0, node_count=1,
+                 block_size=BLOCK_SIZE):
+        if node_count > 1 and seed is None:
+            raise ValueError("nodes must share a seed to share a permutation")
+        self.pattern = generator.Pattern(fields)
+        generator.warn_if_ambiguous(self.pattern)
+        perm = permutation.FeistelPermutation(self.pattern.count, seed)
+        self.partition = generator.Partition(self.pattern.count, node_id, node_count, perm)
+        self.limit = min(limit, self.partition.count)
+        self.block_size = block_size
+        self.cursor = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        positions = getattr(self.local, "positions", None)
+        position = next(positions, None) if positions is not None else None
+        if position is None:
+            self.local.positions = positions = iter(self._reserve(self.block_size))
+            position = next(positions, None)
+            if position is None:
+                raise StopIteration()
+        return self.pattern.format_rank(self.partition.rank(position))
+
+    def _reserve(self, n):
+        """Take up to n cursor positions from the shared walk."""
+        with self.lock:
+            n = min(n, self.limit)
+            begin = self.cursor
+            self.cursor += n
+            self.limit -= n
+        return range(begin, begin + n)
+
+    def remaining(self):
+        """Return how many identifiers of the share were not reserved yet."""
+        with self.lock:
+            return self.partition.count - self.cursor
+
+    def generate_batch(self, n):
+        format_rank, rank = self.pattern.format_rank, self.partition.rank
+        return [format_rank(rank(position)) for position in self._reserve(n)]
+
+    def generate_ranks(self, n):
+        """Return the ranks of up to n next identifiers, not formatted."""
+        return [self.partition.rank(position) for position in self._reserve(n)]
+
+    def getstate(self):
+        """Return the state to resume from, as a JSON-able dict and bytes."""
+        with self.lock:
+            return {"limit": self.limit, "cursor": self.cursor}, b""
+
+    def setstate(self, state, payload):
+        """Resume from a state of a generator built with the same arguments."""
+        with self.lock:
+            self.limit = state["limit"]
+            self.cursor = state["cursor"]
+            self.local = threading.local()
+
+
+_worker = None
+
+
+def _init_worker(pattern, seed, node_id, node_count, ranks):
+    global _worker
+    perm = permutation.FeistelPermutation(pattern.count, seed)
+    _worker = (pattern, generator.Partition(pattern.count, node_id, node_count, perm), ranks)
+
+
+def _generate_chunk(begin, end):
+    pattern, partition, ranks = _worker
+    if ranks:
+        return [partition.rank(cursor) for cursor in range(begin, end)]
+    return [pattern.format_rank(partition.rank(cursor)) for cursor in range(begin, end)]
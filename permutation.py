@@ -0,0 +1,48 @@
+
+import random
+
+
+class FeistelPermutation:
+    """Keyed bijection of range(size).
+
+    A balanced Feistel network permutes the smallest even-width binary domain
+    holding the range, and indexes landing outside of the range are fed again
+    to the network (cycle walking) until they fall back inside.
+    """
+
+    rounds = 4
+
+    def __init__(self, size, seed=None):
+        assert size >= 0
+        self.size = size
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2) if size else 1
+        self.half_mask = (1 << self.half_bits) - 1
+        self.word_bits = max(64, self.half_bits)
+        self.word_mask = (1 << self.word_bits) - 1
+        rng = random.Random(seed)
+        self.keys = tuple(rng.getrandbits(self.word_bits) for _ in range(self.rounds))
+        self.multiplier = rng.getrandbits(self.word_bits) | 1
+
+    def __len__(self):
+        return self.size
+
+    def __call__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError("index {} out of permutation range".format(index))
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def _round(self, value, key):
+        value = ((value ^ key) * self.multiplier) & self.word_mask
+        value ^= value >> (self.word_bits // 2)
+        value = (value * self.multiplier) & self.word_mask
+        return value >> (self.word_bits - self.half_bits)
+
+    def _encrypt(self, value):
+        left = value >> self.half_bits
+        right = value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
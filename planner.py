@@ -0,0 +1,252 @@
+
+import array
+import logging
+import math
+import os
+import random
+
+import dedupe
+import engine as engines
+import generator
+
+
+# seconds per identifier or per attempt, measured on a laptop
+COST_RANDOM_ATTEMPT = 3e-6
+COST_BLOOM_ATTEMPT = 10e-6
+# per encryption, a walk needs (smallest even power of two over the space) / space
+COST_FEISTEL = 3.4e-6
+COST_SCAN = 0.5e-6
+# bytes per remembered identifier
+SET_ITEM_SIZE = 8
+WIDE_SET_ITEM_SIZE = 80
+
+BLOOM_ERROR_RATE = 1e-6
+# widest space enumerated for a shuffle
+SHUFFLE_MAX_SPACE = 2**24
+# average attempts per identifier of a batch past which random draws are
+# replaced by a shuffle of the identifiers left
+SWITCH_ATTEMPTS = 4
+# share of the available memory a plan may use
+MEMORY_SHARE = 0.5
+DEFAULT_MEMORY = 2**30
+
+STRATEGIES = ("set", "bitmap", "permutation", "shuffle", "bloom")
+# strategies only telling how random draws will remember identifiers: both
+# build the same generator, whose adaptive store picks its form by itself
+RANDOM_STORES = ("set", "bitmap")
+
+
+class Plan:
+    """Strategy chosen to produce `limit` identifiers out of `space`."""
+
+    def __init__(self, strategy, space, limit, memory, seconds, reason):
+        self.strategy = strategy
+        self.space = space
+        self.limit = limit
+        self.memory = memory
+        self.seconds = seconds
+        self.reason = reason
+
+    def __repr__(self):
+        return "Plan({!r}, memory={}, seconds={:.3g})".format(self.strategy, self.memory, self.seconds)
+
+    def explain(self):
+        """Return the plan as text, for people."""
+        strategy = self.strategy
+        if strategy in RANDOM_STORES:
+            strategy += " (random draws, remembered by an adaptive store)"
+        return ("strategy: {}\n"
+                "identifiers: {} of {} ({:.2%})\n"
+                "estimated memory: {}\n"
+                "estimated time: {:.3g}s\n"
+                "reason: {}").format(strategy, self.limit, self.space,
+                                     self.limit / self.space if self.space else 0,
+                                     _size(self.memory), self.seconds, self.reason)
+
+
+def available_memory():
+    """Return the available physical memory in bytes, or a guess."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return DEFAULT_MEMORY
+
+
+def expected_attempts(space, limit):
+    """Return the expected draws of `limit` distinct values out of `space`."""
+    if limit <= 0:
+        return 0
+    if limit >= space:
+        # harmonic number of the space
+        return space * (math.log(space) + 0.5772156649 + 1 / (2 * space))
+    return max(limit, -space * math.log1p(-limit / space))
+
+
+def estimate(strategy, space, limit):
+    """Return the estimated memory (bytes) and time (seconds) of a strategy."""
+    if strategy == "set":
+        item_size = SET_ITEM_SIZE if space <= 2**64 else WIDE_SET_ITEM_SIZE
+        return limit * item_size, expected_attempts(space, limit) * COST_RANDOM_ATTEMPT
+    if strategy == "bitmap":
+        return (space + 7) // 8, expected_attempts(space, limit) * COST_RANDOM_ATTEMPT
+    if strategy == "bloom":
+        nbits = -limit * math.log(BLOOM_ERROR_RATE) / math.log(2) ** 2
+        return math.ceil(nbits / 8), expected_attempts(space, limit) * COST_BLOOM_ATTEMPT
+    if strategy == "permutation":
+        if not space:
+            return 0, 0.0
+        half_bits = max(1, ((space - 1).bit_length() + 1) // 2)
+        return 0, limit * COST_FEISTEL * 2**(2 * half_bits) / space
+    if strategy == "shuffle":
+        return 8 * space, space * COST_SCAN + limit * COST_RANDOM_ATTEMPT
+    raise ValueError("unknown strategy '{}'".format(strategy))
+
+
+def plan(space, limit, memory=None):
+    """Return the fastest plan fitting in memory.
+
+    `memory` is the number of bytes a plan may use, a share of the available
+    memory by default. The permutation walk always fits.
+    """
+    if memory is None:
+        memory = int(available_memory() * MEMORY_SHARE)
+    limit = min(limit, space)
+    if not limit:
+        return Plan("permutation", space, limit, 0, 0.0, "there is no identifier to produce")
+    candidates = []
+    for strategy in STRATEGIES:
+        if strategy in RANDOM_STORES and strategy != random_store(space, limit):
+            continue
+        if strategy == "shuffle" and space > SHUFFLE_MAX_SPACE:
+            continue
+        needed, seconds = estimate(strategy, space, limit)
+        if needed <= memory:
+            candidates.append((seconds, needed, strategy))
+    seconds, needed, strategy = min(candidates)
+
+    ratio = limit / space if space else 0
+    reasons = {
+        "set": "few identifiers out of a wide space ({:.2%}): random draws rarely collide,"
+               " and remembering them costs less than a bitmap".format(ratio),
+        "bitmap": "a bitmap of the whole space is smaller than the set of identifiers,"
+                  " and random draws collide little at {:.2%} of the space".format(ratio),
+        "permutation": "a walk needs no memory and no retries, while the others would not fit"
+                       " in {} or would retry too much at {:.2%} of the space".format(_size(memory), ratio),
+        "shuffle": "{:.2%} of a small space is asked: shuffling it avoids the retries"
+                   " of random draws".format(ratio),
+        "bloom": "remembering the identifiers exactly needs more than {} of memory".format(_size(memory)),
+    }
+    return Plan(strategy, space, limit, needed, seconds, reasons[strategy])
+
+
+def random_store(space, limit):
+    """Return how random draws remember `limit` identifiers out of `space`.
+
+    It follows `dedupe.AdaptiveStore`, which ends as a bitmap once it is
+    the smaller.
+    """
+    if space > 2**64:
+        return "set"
+    if space <= dedupe.SMALL_SPACE or limit >= space // dedupe.BITS_PER_RANK:
+        return "bitmap"
+    return "set"
+
+
+def build(strategy, fields, limit, seed=None, node_id=0, node_count=1, registry=None, engine=None):
+    """Return a generator following the strategy of a plan."""
+    if strategy == "permutation":
+        return generator.PermutationIdentifierGenerator(fields, limit, seed, node_id, node_count, registry)
+    error_rate = BLOOM_ERROR_RATE if strategy == "bloom" and registry is None else None
+    gen = PlannedIdentifierGenerator(fields, limit, error_rate, node_id, node_count, seed,
+                                     registry, engine)
+    if strategy == "shuffle":
+        gen.switch()
+    return gen
+
+
+class PlannedIdentifierGenerator(generator.IdentifierGenerator):
+    """Random generator switching to a shuffle when draws retry too much.
+
+    Once a batch needs more than `SWITCH_ATTEMPTS` draws per identifier, the
+    identifiers not produced yet are enumerated and shuffled, then taken in
+    order. Produced identifiers are still recorded, so states and
+    registries stay valid.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = logging.getLogger("planner")
+        self.left = None
+
+    def can_switch(self):
+        return (self.left is None and self.partition.count <= SHUFFLE_MAX_SPACE
+                and not isinstance(self.produced, dedupe.BloomFilter))
+
+    def switch(self):
+        """Enumerate the identifiers left and shuffle them, to be taken in order."""
+        self.log.info("enumerating the identifiers left, to shuffle them")
+        with self.stats.timer("dedupe"):
+            if len(self.produced):
+                left = [index for index in range(self.partition.count)
+                        if self._key(index) not in self.produced]
+            else:
+                left = range(self.partition.count)
+        with self.stats.timer("draw"):
+            rng = self.engine.numpy_generator()
+            if rng is not None:
+                numpy = engines.import_numpy()
+                shuffled = numpy.array(left, dtype=numpy.uint64)
+                rng.shuffle(shuffled)
+                self.left = array.array("Q", shuffled.tobytes())
+            else:
+                left = array.array("Q", left)
+                random.Random(self.engine.randbelow(2**64)).shuffle(left)
+                self.left = left
+
+    def __next__(self):
+        if self.left is None:
+            return super().__next__()
+        batch = self.generate_batch(1)
+        if not batch:
+            raise StopIteration()
+        return batch[0]
+
+    def _batch(self, n, formatted):
+        if self.left is None:
+            draws = self.stats.produced + self.stats.collisions
+            batch = super()._batch(n, formatted)
+            draws = self.stats.produced + self.stats.collisions - draws
+            if batch and self.can_switch() and draws > SWITCH_ATTEMPTS * len(batch):
+                self.switch()
+            return batch
+
+        left = self.left
+        indexes = []
+        wanted = min(n, self.limit)
+        while len(indexes) < wanted and left:
+            taken = left[-(wanted - len(indexes)):]
+            del left[-len(taken):]
+            # ambiguous identifiers may have been produced by another index
+            with self.stats.timer("dedupe"):
+                indexes.extend(index for index in taken if self.produced.insert(self._key(index)))
+        self.stats.record_batch(len(indexes), len(indexes))
+        self.limit -= len(indexes)
+        rank = self.partition.rank
+        if not formatted:
+            return [rank(index) for index in indexes]
+        with self.stats.timer("format"):
+            format_rank = self.pattern.format_rank
+            return [format_rank(rank(index)) for index in indexes]
+
+    def setstate(self, state, payload):
+        super().setstate(state, payload)
+        if self.left is not None:
+            self.switch()
+
+
+def _size(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return "{:.0f} {}".format(n, unit)
+        n /= 1024
+    return "{:.0f} TiB".format(n)
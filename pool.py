@@ -0,0 +1,111 @@
+
+import collections
+import threading
+
+
+class IdentifierPool:
+    """Buffer of ready-made identifiers, refilled by a background thread.
+
+    The thread fills the buffer by batches up to `size`, then fills it up
+    again as soon as it drops below `low_water`. Taking an identifier only
+    pops it from the buffer, whatever the retries the generator goes
+    through, unless the buffer is empty: the taker then waits for the
+    refill (a stall). An error of the generator is raised by `take()` once
+    the buffer is empty.
+    """
+
+    def __init__(self, gen, size=65536, low_water=None, batch=None):
+        self.gen = gen
+        self.size = size
+        self.low_water = max(1, size // 4) if low_water is None else low_water
+        self.batch = max(1, size // 8) if batch is None else batch
+        if not 1 <= self.low_water <= size:
+            raise ValueError("low water must be in [1, {}]".format(size))
+        if self.batch < 1:
+            raise ValueError("batch must be at least 1")
+        self.buffer = collections.deque()
+        self.condition = threading.Condition()
+        self.hits = 0
+        self.stalls = 0
+        self.refills = 0
+        self.exhausted = False
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._refill, name="idgen-pool", daemon=True)
+        self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.take()
+        except IndexError:
+            raise StopIteration() from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def take(self):
+        """Return the next identifier, raise IndexError once all were taken."""
+        with self.condition:
+            if self.buffer:
+                self.hits += 1
+            else:
+                self.stalls += 1
+                self.condition.notify_all()
+                while not self.buffer and not self.exhausted:
+                    self.condition.wait()
+                if not self.buffer:
+                    if self.error is not None:
+                        raise self.error
+                    raise IndexError("identifier pool is exhausted")
+            newest = self.buffer.popleft()
+            if len(self.buffer) < self.low_water:
+                self.condition.notify_all()
+            return newest
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def stats(self):
+        with self.condition:
+            return {"hits": self.hits, "stalls": self.stalls, "refills": self.refills,
+                    "ready": len(self.buffer)}
+
+    def _refill(self):
+        filling = True
+        while True:
+            with self.condition:
+                if len(self.buffer) >= self.size:
+                    filling = False
+                # once full, wait for the buffer to drop below low water
+                while not filling and len(self.buffer) >= self.low_water and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                filling = True
+                wanted = min(self.batch, self.size - len(self.buffer))
+
+            error = None
+            try:
+                ids = self.gen.generate_batch(wanted)
+            except Exception as e:
+                # raised by take() once the identifiers ready are taken
+                ids, error = [], e
+
+            with self.condition:
+                self.buffer.extend(ids)
+                self.refills += 1
+                if not ids:
+                    self.error = error
+                    self.exhausted = True
+                self.condition.notify_all()
+                if self.exhausted:
+                    return
@@ -0,0 +1,121 @@
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+
+
+MAGIC = b"IDGENREG"
+# magic, issued count, pattern space, length of the expression
+HEADER = struct.Struct("<8sQQI")
+PAGE_SIZE = 4096
+# a bitmap of 2**40 bits is a sparse file of 128 GiB
+MAX_SPACE = 2**40
+
+
+class Registry:
+    """Identifiers issued for a pattern, kept in a memory-mapped bitmap file.
+
+    The file holds one bit per rank of the pattern, after a header recording
+    the expression it belongs to. It is locked for the lifetime of the
+    registry, so concurrent runs on the same file take turns. Lookups and
+    updates go through the page cache only.
+    """
+
+    def __init__(self, path, expression, pattern):
+        if pattern.count > MAX_SPACE:
+            raise ValueError("pattern space is too wide for a registry ({} identifiers)"
+                             .format(pattern.count))
+        self.log = logging.getLogger("registry")
+        self.pattern = pattern
+        key = expression.encode("utf-8")
+        self.offset = _round_up(HEADER.size + len(key), PAGE_SIZE)
+        size = self.offset + (pattern.count + 7) // 8
+
+        self.file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.file.seek(0)
+        header = self.file.read(HEADER.size + len(key))
+        if not header:
+            self.file.truncate(size)
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, 0, pattern.count, len(key)) + key)
+            self.file.flush()
+        else:
+            error = _header_error(header, pattern.count, key)
+            if error:
+                self.file.close()
+                raise ValueError("'{}' is {}".format(path, error))
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.map = None
+            self.file.close()
+
+    def __len__(self):
+        return HEADER.unpack_from(self.map)[1]
+
+    def __contains__(self, rank):
+        return bool(self.map[self.offset + (rank >> 3)] >> (rank & 7) & 1)
+
+    def insert(self, rank):
+        """Add the rank, return whether it was missing."""
+        position = self.offset + (rank >> 3)
+        bit = 1 << (rank & 7)
+        byte = self.map[position]
+        if byte & bit:
+            return False
+        self.map[position] = byte | bit
+        struct.pack_into("<Q", self.map, 8, len(self) + 1)
+        return True
+
+    add = insert
+
+    def import_identifiers(self, lines):
+        """Register identifiers, one per line, return how many were new.
+
+        Lines not matching the pattern are skipped with a warning.
+        """
+        imported = 0
+        for number, line in enumerate(lines, 1):
+            identifier = line.rstrip("\r\n")
+            if not identifier:
+                continue
+            try:
+                rank = self.pattern.rank(identifier)
+            except ValueError:
+                self.log.warning("line {}: '{}' does not match the pattern".format(number, identifier))
+                continue
+            imported += self.insert(rank)
+        return imported
+
+    def dump(self):
+        """Flush the registry; its content is already on disk."""
+        self.map.flush()
+        return {"kind": "registry"}, b""
+
+    def restore(self, meta, data):
+        pass
+
+
+def _header_error(header, space, key):
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return "not a registry file"
+    _, _, saved_space, key_size = HEADER.unpack_from(header)
+    if (saved_space, header[HEADER.size:HEADER.size + key_size]) != (space, key):
+        return "the registry of another pattern"
+    return None
+
+
+def _round_up(value, multiple):
+    return (value + multiple - 1) // multiple * multiple
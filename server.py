@@ -0,0 +1,107 @@
+
+import asyncio
+import logging
+
+import exprparse
+import generator
+
+
+# a single request cannot ask for more
+MAX_COUNT = 1000000
+# identifiers generated before other clients are served again
+SLICE_SIZE = 10000
+
+
+def default_generator(pattern):
+    return generator.IdentifierGenerator(pattern.fields, pattern.count)
+
+
+class IdentifierServer:
+    """Server of unique identifiers, over a line protocol.
+
+    A request is "GET <pattern> <count>", answered by "OK <n>" followed by
+    n identifiers, one per line, or by "ERR <message>". Requests of a
+    connection are answered in order, so a client can send several before
+    reading the answers. One generator is kept per pattern, so identifiers
+    are unique across all clients of the server.
+
+    Identifiers are generated by slices, between which other clients are
+    served. Ambiguous patterns are refused when they are too wide to
+    count their distinct identifiers.
+    """
+
+    def __init__(self, make_generator=default_generator):
+        self.log = logging.getLogger("server")
+        self.make_generator = make_generator
+        self.generators = {}
+
+    def generator_of(self, expression):
+        gen = self.generators.get(expression)
+        if gen is None:
+            pattern = exprparse.compile(expression)
+            if pattern.ambiguous and pattern.count > generator.AMBIGUOUS_MAX_COUNT:
+                raise ValueError("ambiguous pattern wider than {} identifiers"
+                                 .format(generator.AMBIGUOUS_MAX_COUNT))
+            gen = self.make_generator(pattern)
+            self.generators[expression] = gen
+        return gen
+
+    async def answer(self, line):
+        """Return the answer to a request line."""
+        command, _, arguments = line.strip().partition(" ")
+        if command != "GET":
+            return "ERR unknown command \"{}\"\n".format(command)
+        expression, _, count = arguments.rpartition(" ")
+        if not expression or not count.isdigit() or int(count) > MAX_COUNT:
+            return "ERR expect \"GET <pattern> <count>\" with count up to {}\n".format(MAX_COUNT)
+
+        try:
+            gen = self.generator_of(expression)
+        except exprparse.PatternError as e:
+            return "ERR invalid pattern, {}\n".format(e)
+        except ValueError as e:
+            return "ERR {}\n".format(e)
+        count = int(count)
+        ids = []
+        while len(ids) < count:
+            batch = gen.generate_batch(min(SLICE_SIZE, count - len(ids)))
+            if not batch:
+                break
+            ids.extend(batch)
+            await asyncio.sleep(0)
+        return "OK {}\n{}".format(len(ids), "".join(id_ + "\n" for id_ in ids))
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write((await self.answer(line.decode("utf-8", "replace"))).encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """Listen on the unix socket `path`, or on a TCP port of `host`."""
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        for sock in server.sockets:
+            self.log.info("listening on {}".format(sock.getsockname()))
+        return server
+
+
+def serve(path=None, host="127.0.0.1", port=0, make_generator=default_generator):
+    """Run an identifier server until interrupted."""
+    async def run():
+        server = await IdentifierServer(make_generator).start(path, host, port)
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,131 @@
+
+import collections
+import logging
+import math
+import time
+
+
+# fill ratios of the space warned about, once each
+WARN_FILL_RATIOS = (0.9, 0.99)
+# attempts per identifier past which an exhaustion is near
+WARN_ATTEMPTS = 20
+
+
+class GenerationStats:
+    """Statistics of a generator drawing identifiers with retries.
+
+    They count the attempts needed by each identifier (a histogram, by
+    powers of two of attempts), the collisions with identifiers produced before,
+    the filled ratio of the space and the time spent by each stage of the
+    generation: drawing, deduplicating and formatting.
+
+    A warning is logged when the space gets nearly full or when an
+    identifier needed many attempts, before retries get out of hand. The
+    `callback`, if any, is given the statistics every `every` identifiers.
+    """
+
+    def __init__(self, space, filled=0, callback=None, every=100000):
+        self.log = logging.getLogger("telemetry")
+        self.space = space
+        self.filled = filled
+        self.callback = callback
+        self.every = every
+        self.attempts = collections.Counter()
+        self.produced = 0
+        self.collisions = 0
+        self.timings = collections.Counter()
+        self.warned = set()
+        self.next_callback = every if callback is not None else math.inf
+        self.next_warning = self._next_warning()
+
+    @property
+    def fill_ratio(self):
+        return self.filled / self.space if self.space else 1.0
+
+    def record(self, attempts):
+        """Count a new identifier, drawn `attempts` times."""
+        # the same as _count(), inlined as it runs for every identifier
+        self.attempts[1 << (attempts - 1).bit_length()] += 1
+        self.produced += 1
+        self.filled += 1
+        self.collisions += attempts - 1
+        if (self.filled >= self.next_warning or attempts >= WARN_ATTEMPTS
+                or self.produced >= self.next_callback):
+            self._check(attempts)
+
+    def record_batch(self, draws, kept):
+        """Count `kept` new identifiers out of `draws` drawn at once.
+
+        The identifiers of a batch are counted with the average attempts of
+        the batch.
+        """
+        self._count(max(1, round(draws / kept)) if kept else draws, kept, draws - kept)
+
+    def _count(self, attempts, count, collisions):
+        if count:
+            # bucket of the identifiers needing up to this many attempts
+            self.attempts[1 << (attempts - 1).bit_length()] += count
+        self.produced += count
+        self.filled += count
+        self.collisions += collisions
+        if (self.filled >= self.next_warning or attempts >= WARN_ATTEMPTS
+                or self.produced >= self.next_callback):
+            self._check(attempts)
+
+    def timer(self, stage):
+        """Return a context manager adding its duration to a stage."""
+        return _Timer(self.timings, stage)
+
+    def _next_warning(self):
+        """Return the fill of the next ratio to warn about."""
+        return min((ratio * self.space for ratio in WARN_FILL_RATIOS if ratio not in self.warned),
+                   default=math.inf)
+
+    def _check(self, attempts):
+        for ratio in WARN_FILL_RATIOS:
+            if self.fill_ratio >= ratio and ratio not in self.warned:
+                self.warned.add(ratio)
+                self.log.warning("{:.0%} of the pattern space is used, draws will slow down"
+                                 .format(ratio))
+        self.next_warning = self._next_warning()
+        if attempts >= WARN_ATTEMPTS and "attempts" not in self.warned:
+            self.warned.add("attempts")
+            self.log.warning("an identifier needed {} attempts, the pattern space is nearly"
+                             " exhausted ({:.1%} used)".format(attempts, self.fill_ratio))
+        if self.produced >= self.next_callback:
+            self.next_callback = self.produced + self.every
+            self.callback(self)
+
+    def as_dict(self):
+        return {
+            "produced": self.produced,
+            "collisions": self.collisions,
+            "fill_ratio": self.fill_ratio,
+            "attempts": dict(sorted(self.attempts.items())),
+            "seconds": dict(self.timings),
+        }
+
+    def report(self):
+        """Return the statistics as text."""
+        lines = ["identifiers: {}".format(self.produced),
+                 "collisions: {}".format(self.collisions),
+                 "space used: {:.2%} of {}".format(self.fill_ratio, self.space),
+                 "attempts per identifier:"]
+        lines.extend("  up to {:>6}: {}".format(attempts, count)
+                     for attempts, count in sorted(self.attempts.items()))
+        lines.extend("{} time: {:.3f}s".format(stage, seconds)
+                     for stage, seconds in sorted(self.timings.items()))
+        return "\n".join(lines)
+
+
+class _Timer:
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.stage] += time.perf_counter() - self.begin
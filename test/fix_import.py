@@ -6,3 +6,4 @@ root = os.path.dirname(folder)
 src = os.path.join(root, "src")
 
 sys.path.insert(0, src)
+sys.path.insert(1, root)
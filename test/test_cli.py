@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import fix_import
+import exprparse
+import generator
+import idgen
+
+
+IDGEN = os.path.join(fix_import.root, "idgen.py")
+
+
+def run(*args):
+    return subprocess.run([sys.executable, IDGEN] + list(args), stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, cwd=fix_import.root)
+
+
+class TestStream(unittest.TestCase):
+
+    def test_count_zero_stops_when_exhausted(self):
+        done = run("ID-[1-500]", "--count", "0")
+        self.assertEqual(done.returncode, 0)
+        ids = done.stdout.decode().split()
+        self.assertEqual(sorted(ids), sorted("ID-{}".format(i) for i in range(1, 501)))
+
+    def test_sequential_stream(self):
+        done = run("[1-3]-[1-2]", "--stream", "--sequential")
+        self.assertEqual(done.stdout.decode().split(), ["1-1", "1-2", "2-1", "2-2", "3-1", "3-2"])
+
+    def test_closed_pipe(self):
+        process = subprocess.Popen([sys.executable, IDGEN, "[1-999999999999]", "--stream"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   cwd=fix_import.root)
+        self.assertEqual(len(process.stdout.readline().split()), 1)
+        process.stdout.close()
+        self.assertEqual(process.wait(timeout=60), 141)
+        self.assertEqual(process.stderr.read(), b"")
+        process.stderr.close()
+
+    def test_walk_remembers_nothing(self):
+        fields = exprparse.Source("[1-999999999999]").parse_and_build()
+        for options in (["--stream"], ["--count", "0"], ["--stream", "--seed", "4"]):
+            with mock.patch.object(sys, "argv", ["idgen.py", "[1-999999999999]"] + options):
+                args = idgen.parse_args()
+            gen = idgen.make_generator(args, fields)
+            self.assertIsInstance(gen, generator.PermutationIdentifierGenerator)
+            gen.generate_batch(1000)
+            self.assertEqual(gen.getstate()[1], b"")
+
+    def test_rejected_options(self):
+        for options in (["--stream", "--count", "5"], ["--stream", "-e", "0.01"],
+                        ["--count", "0", "-e", "0.01"]):
+            done = run("[1-9]", *options)
+            self.assertEqual(done.returncode, 2, options)
+            self.assertIn(b"error:", done.stderr)
+
+
+class TestOptions(unittest.TestCase):
+
+    def test_rejected_options(self):
+        for options in (["--serve", "--jobs", "2"],
+                        ["[1-9]", "--checkpoint-every", "0"],
+                        ["[1-9]", "--sequential", "--start", "10"],
+                        ["[1-9]", "--sequential", "--start", "-1"],
+                        ["[1-9]", "--node-id", "2", "--node-count", "2", "--seed", "1"],
+                        ["[1-9]", "--node-id", "-1"],
+                        ["[1-9]", "--node-count", "0"]):
+            done = run(*options)
+            self.assertEqual(done.returncode, 2, options)
+            self.assertIn(b"error:", done.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+
+import os
+import tempfile
+import unittest
+import random
+
+import fix_import
+import dedupe
+import engine
+import exprparse
+import generator
+import registry
+
+
+class TestStores(unittest.TestCase):
+
+    def _test_store(self, store, space):
+        rng = random.Random(7)
+        ranks = [rng.randrange(space) for _ in range(20000)]
+        for rank in ranks:
+            store.add(rank)
+        expected = set(ranks)
+        self.assertEqual(len(store), len(expected))
+        self.assertEqual(sorted(store), sorted(expected))
+        for rank in range(0, space, max(1, space // 5000)):
+            self.assertEqual(rank in store, rank in expected)
+
+    def test_bitmap(self):
+        self._test_store(dedupe.BitmapStore(50000), 50000)
+
+    def test_chunked_array(self):
+        self._test_store(dedupe.ChunkedArrayStore(), 2**64)
+        self._test_store(dedupe.ChunkedArrayStore(), 30000)
+
+    @unittest.skipIf(engine.import_numpy() is None, "NumPy is not installed")
+    def test_insert_sorted(self):
+        numpy = engine.import_numpy()
+        rng = random.Random(9)
+        for space in (50000, 2**40):
+            store, expected = dedupe.AdaptiveStore(space), set()
+            for _ in range(5):
+                drawn = set(rng.randrange(space) for _ in range(9000))
+                drawn.update(rng.sample(sorted(expected), min(500, len(expected))))
+                ranks = numpy.array(sorted(drawn), dtype=numpy.int64)
+                missing = store.insert_sorted(ranks)
+                self.assertEqual(missing.tolist(), [rank not in expected for rank in ranks.tolist()])
+                expected.update(ranks.tolist())
+            self.assertEqual(len(store), len(expected))
+            self.assertEqual(list(store), sorted(expected))
+
+    def test_adaptive_switches_to_bitmap(self):
+        space = 2**20
+        store = dedupe.AdaptiveStore(space)
+        self.assertFalse(store.dense)
+        for rank in range(0, space, 128):
+            store.add(rank)
+        self.assertFalse(store.dense)
+        for rank in range(1, space, 128):
+            store.add(rank)
+        self.assertTrue(store.dense)
+        self.assertEqual(len(store), space // 64)
+        self.assertIn(129, store)
+        self.assertNotIn(130, store)
+
+    def test_adaptive_snapshot(self):
+        for space, count in ((2**16, 500), (2**40, 500), (2**20, 2**15), (2**80, 500)):
+            store = dedupe.AdaptiveStore(space)
+            rng = random.Random(space)
+            for _ in range(count):
+                store.add(rng.randrange(space))
+            copy = dedupe.AdaptiveStore(space)
+            copy.restore(*store.dump())
+            self.assertEqual(len(copy), len(store))
+            self.assertEqual(sorted(copy), sorted(store))
+
+    def test_adaptive_wide_space(self):
+        store = dedupe.AdaptiveStore(2**80)
+        store.add(2**70)
+        self.assertIn(2**70, store)
+        self.assertNotIn(2**71, store)
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negative(self):
+        bloom = dedupe.BloomFilter(10000, 0.01)
+        ranks = range(0, 10**12, 10**8)
+        for rank in ranks:
+            bloom.add(rank)
+        for rank in ranks:
+            self.assertIn(rank, bloom)
+
+    def test_error_rate(self):
+        bloom = dedupe.BloomFilter(10000, 0.01)
+        for rank in range(10000):
+            bloom.add(rank)
+        false_positives = sum(rank in bloom for rank in range(10000, 110000))
+        self.assertLess(false_positives, 2000)
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "issued.reg")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _open(self, expr):
+        pattern = exprparse.Source(expr).parse_and_compile()
+        return registry.Registry(self.path, expr, pattern)
+
+    def test_persistent(self):
+        with self._open("DOC-[1-5000|4z]") as issued:
+            self.assertTrue(issued.insert(4321))
+            self.assertFalse(issued.insert(4321))
+        with self._open("DOC-[1-5000|4z]") as issued:
+            self.assertEqual(len(issued), 1)
+            self.assertIn(4321, issued)
+            self.assertNotIn(4320, issued)
+
+    def test_import(self):
+        with self._open("DOC-[1-50|3z]") as issued:
+            imported = issued.import_identifiers(["DOC-001\n", "DOC-001\n", "junk\n", "DOC-050"])
+            self.assertEqual(imported, 2)
+            ids = list(generator.IdentifierGenerator(issued.pattern.fields, 100, registry=issued))
+        self.assertEqual(len(ids), 48)
+        self.assertNotIn("DOC-001", ids)
+        self.assertNotIn("DOC-050", ids)
+
+    def test_ambiguous_pattern(self):
+        with self._open("[1-20][1-20]") as issued:
+            fields = issued.pattern.fields
+            ids = list(generator.IdentifierGenerator(fields, 300, registry=issued))
+            gen = generator.IdentifierGenerator(fields, 400, registry=issued)
+            self.assertEqual(gen.limit, 91)
+            ids += gen
+        self.assertEqual(len(set(ids)), 391)
+
+    def test_nodes(self):
+        with self._open("[1-4]") as issued:
+            issued.insert(0)
+            issued.insert(2)
+            fields = issued.pattern.fields
+            with self.assertRaises(ValueError):
+                generator.IdentifierGenerator(fields, 2, node_count=2, registry=issued)
+            ids = list(generator.PermutationIdentifierGenerator(fields, 2, 1, 0, 2, issued))
+            ids += generator.PermutationIdentifierGenerator(fields, 2, 1, 1, 2, issued).generate_batch(2)
+        self.assertEqual(sorted(ids), ["2", "4"])
+
+    def test_other_pattern(self):
+        self._open("DOC-[1-50|3z]").close()
+        with self.assertRaises(ValueError):
+            self._open("DOC-[1-51|3z]")
+
+
+if __name__ == "__main__":
+    unittest.main()
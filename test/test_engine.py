@@ -0,0 +1,65 @@
+
+import json
+import unittest
+
+import fix_import
+import engine
+import exprparse
+import generator
+
+
+class TestEngines(unittest.TestCase):
+
+    def _names(self):
+        return [name for name in engine.ENGINES if name != "numpy" or engine.import_numpy() is not None]
+
+    def test_randbelow_bounds(self):
+        for name in self._names():
+            eng = engine.make(name)
+            for n in (1, 2, 3, 7, 1000, 2**64, 2**64 + 1, 10**30):
+                values = [eng.randbelow(n) for _ in range(200)]
+                self.assertTrue(all(0 <= v < n for v in values))
+            self.assertEqual(set(eng.randbelow(3) for _ in range(300)), {0, 1, 2})
+
+    def test_seeded_engines_are_reproducible(self):
+        for name in self._names():
+            if name == "secrets":
+                continue
+            first, second = engine.make(name, 12), engine.make(name, 12)
+            self.assertEqual([first.randbelow(10**6) for _ in range(20)],
+                             [second.randbelow(10**6) for _ in range(20)])
+
+    def test_state(self):
+        for name in self._names():
+            first = engine.make(name)
+            first.numpy_generator()
+            first.randbelow(10**6)
+            state = json.loads(json.dumps(first.getstate()))
+            second = engine.make(name)
+            second.setstate(state)
+            if name == "secrets":
+                continue
+            self.assertEqual([first.randbelow(10**30) for _ in range(20)],
+                             [second.randbelow(10**30) for _ in range(20)])
+            if first.numpy_generator() is not None:
+                self.assertEqual(list(first.numpy_generator().integers(0, 1000, 20)),
+                                 list(second.numpy_generator().integers(0, 1000, 20)))
+
+    def test_seeded_generator_is_reproducible(self):
+        fields = exprparse.Source("MPL-[1-999|z]-IDR-[1-4]").parse_and_build()
+        first = generator.IdentifierGenerator(fields, 100, seed=5)
+        second = generator.IdentifierGenerator(fields, 100, seed=5)
+        self.assertEqual(list(first), list(second))
+        first = generator.IdentifierGenerator(fields, 100, seed=5)
+        second = generator.IdentifierGenerator(fields, 100, seed=5)
+        self.assertEqual(first.generate_batch(100), second.generate_batch(100))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            engine.make("dice")
+        with self.assertRaises(ValueError):
+            engine.make("secrets", 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
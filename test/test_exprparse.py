@@ -0,0 +1,111 @@
+
+import unittest
+
+import fix_import
+import exprparse
+import generator
+
+
+class TestCompile(unittest.TestCase):
+
+    def setUp(self):
+        exprparse.clear_cache()
+        exprparse.set_cache_size(2)
+
+    def tearDown(self):
+        exprparse.set_cache_size(256)
+        exprparse.clear_cache()
+
+    def test_cache_hit(self):
+        first = exprparse.compile("MPL-[1-999|z]-IDR-[1-4]")
+        second = exprparse.compile("MPL-[1-999|z]-IDR-[1-4]")
+        self.assertIs(first, second)
+        self.assertEqual(first.expression, "MPL-[1-999|z]-IDR-[1-4]")
+        self.assertEqual(exprparse.cache_info(), exprparse.CacheInfo(1, 1, 2, 1))
+
+    def test_lru_eviction(self):
+        a = exprparse.compile("A[1-5]")
+        exprparse.compile("B[1-5]")
+        exprparse.compile("A[1-5]")
+        exprparse.compile("C[1-5]")
+        self.assertIs(exprparse.compile("A[1-5]"), a)
+        self.assertEqual(exprparse.cache_info().currsize, 2)
+        misses = exprparse.cache_info().misses
+        exprparse.compile("B[1-5]")
+        self.assertEqual(exprparse.cache_info().misses, misses + 1)
+
+    def test_pattern_is_immutable(self):
+        pattern = exprparse.compile("A[1-5]")
+        with self.assertRaises(AttributeError):
+            pattern.count = 3
+        with self.assertRaises(AttributeError):
+            del pattern.fields
+
+
+def describe(fields):
+    return [(f.template, f.count) for f in fields]
+
+
+class TestScan(unittest.TestCase):
+
+    def test_same_fields_as_parser(self):
+        for expression in ("MPL-[1-999|z]-IDR-[1-4]", "[1-50]1", "a\\[b\\]c[1-2|3z]", "[01-05|z]",
+                           "[1-5|]", "[1-5|3]", "[1-5|12z]x", "", "\\\\x[0-0]", "[1-2][3-4]"):
+            source = exprparse.Source(expression)
+            self.assertTrue(source.scan(), expression)
+            chars = exprparse.Source(expression)
+            chars.parse_chars()
+            self.assertEqual(describe(source.build()), describe(chars.build()), expression)
+
+    def test_trailing_character(self):
+        self.assertEqual(describe(exprparse.Source("[1-50]1").parse_and_build()), [("%d", 50), ("1", 1)])
+
+    def test_errors(self):
+        for expression, message in (("[1-5", "at character 4: unfinished field declaration"),
+                                    ("[-5]", "at character 1: unspecified start of field"),
+                                    ("[1-]", "at character 3: unspecified end of field"),
+                                    ("a]b", "at character 1: unescaped \"]\""),
+                                    ("[1-5|zz]", "at character 6: expect \"]\""),
+                                    ("[1-2][3", "at character 7: unfinished field declaration")):
+            source = exprparse.Source(expression)
+            self.assertFalse(source.scan())
+            with self.assertRaises(exprparse.PatternError) as error:
+                source.parse()
+            self.assertEqual(str(error.exception), message)
+
+    def test_syntax_errors_come_first(self):
+        for expression in (" [10-1]][", "[5-0]9[\\5 ", "A[5-1]", "[2-1][4-3]", "[3-1]\\"):
+            with self.assertRaises(exprparse.PatternError) as scanned:
+                exprparse.Source(expression).parse_and_build()
+            chars = exprparse.Source(expression)
+            with self.assertRaises(exprparse.PatternError) as parsed:
+                chars.parse_chars()
+                chars.build()
+            self.assertEqual(str(scanned.exception), str(parsed.exception), expression)
+
+
+class TestValidate(unittest.TestCase):
+
+    def test_results(self):
+        results = exprparse.validate_many(["MPL-[1-999|z]-IDR-[1-4]", "A[1-100]", "[1-5", "A[5-1]", ""])
+        self.assertEqual(results[0], exprparse.ValidationResult("MPL-[1-999|z]-IDR-[1-4]",
+                                                                None, None, 3996, 13, 13))
+        self.assertEqual(results[1][3:], (100, 2, 4))
+        self.assertEqual(results[2][1:3], ("unfinished field declaration", 4))
+        self.assertEqual(results[3][1:3], ("start of field greater than its end", 1))
+        self.assertEqual(results[4][3:], (1, 0, 0))
+
+    def test_nothing_compiled(self):
+        tables = dict(generator._tables)
+        result = exprparse.validate("Q-[3-7777|5z]x[1-12]")
+        self.assertEqual(result[3:], (93300, 9, 10))
+        self.assertEqual(generator._tables, tables)
+
+    def test_pool(self):
+        expressions = ["A[1-{}]".format(i) for i in range(1, 50)] + ["[1-"]
+        self.assertEqual(exprparse.validate_many(expressions, jobs=2, chunk_size=8),
+                         exprparse.validate_many(expressions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,417 @@
+
+import concurrent.futures
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import fix_import
+import exprparse
+import checkpoint
+import dedupe
+import engine
+import generator
+import parallel
+import permutation
+
+
+def build(pattern):
+    return exprparse.Source(pattern).parse_and_build()
+
+
+class TestPermutation(unittest.TestCase):
+
+    def test_bijection(self):
+        for size in (0, 1, 2, 3, 5, 16, 17, 1000, 4099):
+            perm = permutation.FeistelPermutation(size, seed=size)
+            self.assertEqual(sorted(perm(i) for i in range(size)), list(range(size)))
+
+    def test_seed_is_reproducible(self):
+        first = permutation.FeistelPermutation(999, seed=42)
+        second = permutation.FeistelPermutation(999, seed=42)
+        self.assertEqual([first(i) for i in range(50)], [second(i) for i in range(50)])
+
+    def test_out_of_range(self):
+        perm = permutation.FeistelPermutation(10)
+        with self.assertRaises(IndexError):
+            perm(10)
+
+
+class TestPermutationIdentifierGenerator(unittest.TestCase):
+
+    def test_whole_space(self):
+        fields = build("DOC-[1-5|3z]")
+        ids = list(generator.PermutationIdentifierGenerator(fields, 10))
+        self.assertEqual(sorted(ids), ["DOC-00{}".format(i) for i in range(1, 6)])
+
+    def test_unique_under_limit(self):
+        fields = build("MPL-[1-999|z]-IDR-[1-4]")
+        ids = list(generator.PermutationIdentifierGenerator(fields, 3000, seed=1))
+        self.assertEqual(len(ids), 3000)
+        self.assertEqual(len(set(ids)), 3000)
+
+
+class TestPattern(unittest.TestCase):
+
+    def test_nth_in_lexicographic_order(self):
+        pattern = exprparse.Source("MPL-[1-999|z]-IDR-[1-4]").parse_and_compile()
+        self.assertEqual(pattern.count, 3996)
+        self.assertEqual(pattern.nth(0), "MPL-001-IDR-1")
+        self.assertEqual(pattern.nth(1), "MPL-001-IDR-2")
+        self.assertEqual(pattern.nth(4), "MPL-002-IDR-1")
+        self.assertEqual(pattern.nth(3995), "MPL-999-IDR-4")
+        with self.assertRaises(IndexError):
+            pattern.nth(3996)
+
+    def test_rank_is_inverse_of_nth(self):
+        for expr in ("MPL-[1-999|z]-IDR-[1-4]", "[1-12][1-3]", "[8-11|3z]x[0-5]"):
+            pattern = exprparse.Source(expr).parse_and_compile()
+            for i in range(pattern.count):
+                self.assertEqual(pattern.rank(pattern.nth(i)), i)
+
+    def test_rank_rejects_foreign_identifier(self):
+        pattern = exprparse.Source("DOC-[1-5|3z]").parse_and_compile()
+        for identifier in ("DOC-006", "DOC-5", "DOC-0005", "XYZ-001", "DOC-001-"):
+            with self.assertRaises(ValueError):
+                pattern.rank(identifier)
+
+    def test_rank_of_ambiguous_pattern(self):
+        # a backtracking without memory would try billions of parses
+        pattern = exprparse.Source("[1-99]" * 60).parse_and_compile()
+        with self.assertRaises(ValueError):
+            pattern.rank("1" * 90 + "x")
+        self.assertEqual(pattern.nth(pattern.rank("1" * 90)), "1" * 90)
+
+
+class TestCompiledFormatter(unittest.TestCase):
+
+    def decode(self, fields, index):
+        """Format a rank field by field, as before patterns were compiled."""
+        parts = []
+        for f in reversed(fields):
+            index, digit = divmod(index, f.count)
+            parts.append(f.at(digit))
+        return "".join(reversed(parts))
+
+    def test_percent_in_literals(self):
+        pattern = generator.Pattern(build("%d-[1-200000]%%-[1-3]%s"))
+        self.assertEqual(pattern.nth(0), "%d-1%%-1%s")
+        self.assertEqual(pattern.nth(pattern.count - 1), "%d-200000%%-3%s")
+        self.assertEqual(pattern.rank("%d-17%%-2%s"), 16 * 3 + 1)
+
+    def test_fold_single_values(self):
+        fields = generator.fold_fields([generator.FixGenerator("A"),
+                                        generator.RangeGenerator(7, 7, 3),
+                                        generator.FixGenerator("-"),
+                                        generator.RangeGenerator(1, 3, False),
+                                        generator.RangeGenerator(5, 5, False)])
+        self.assertEqual([f.count for f in fields], [1, 3, 1])
+        self.assertEqual((fields[0].content, fields[2].content), ("A007-", "5"))
+        self.assertEqual(generator.Pattern(build("[7-7]")).nth(0), "7")
+
+    def test_drop_empty_literals(self):
+        fields = generator.fold_fields([generator.FixGenerator(""),
+                                        generator.RangeGenerator(1, 3, False),
+                                        generator.FixGenerator("")])
+        self.assertEqual(len(fields), 1)
+        self.assertIsInstance(fields[0], generator.RangeGenerator)
+        self.assertEqual(generator.fold_fields([generator.FixGenerator("")]), ())
+        self.assertEqual(generator.Pattern([generator.FixGenerator("")]).nth(0), "")
+
+    def test_same_as_decoding_each_field(self):
+        fields = [generator.FixGenerator("ID-"),
+                  generator.RangeGenerator(1, 999, 3),
+                  generator.RangeGenerator(4, 4, False),
+                  generator.FixGenerator(""),
+                  generator.RangeGenerator(8, 200007, False),
+                  generator.FixGenerator("/"),
+                  generator.RangeGenerator(0, 11, 2)]
+        pattern = generator.Pattern(fields)
+        self.assertEqual(pattern.count, 999 * 200000 * 12)
+        step = pattern.count // 997
+        for index in list(range(0, pattern.count, step)) + [pattern.count - 1]:
+            self.assertEqual(pattern.nth(index), self.decode(fields, index))
+
+
+class TestStringTable(unittest.TestCase):
+
+    def test_shared_table(self):
+        first = generator.RangeGenerator(1, 999, 3)
+        second = generator.RangeGenerator(1, 999, 3)
+        self.assertEqual(first.at(41), "042")
+        self.assertEqual(second.at(998), "999")
+        self.assertIs(first.table, second.table)
+        self.assertIs(first.table, generator.string_table(1, 999, 3))
+
+    def test_wide_field_is_formatted(self):
+        field = generator.RangeGenerator(0, generator.TABLE_MAX_COUNT, 8)
+        self.assertEqual(field.at(1234), "00001234")
+        self.assertEqual(field.table, ())
+        self.assertIsNone(generator.string_table(0, generator.TABLE_MAX_COUNT, 8))
+
+
+class TestBatch(unittest.TestCase):
+
+    def _test_batch(self):
+        fields = build("MPL-[1-999|z]-IDR-[1-4]")
+        gen = generator.IdentifierGenerator(fields, 3000)
+        first = gen.generate_batch(2000)
+        second = gen.generate_batch(2000)
+        self.assertEqual((len(first), len(second)), (2000, 1000))
+        self.assertEqual(len(set(first + second)), 3000)
+        self.assertEqual(gen.generate_batch(10), [])
+        pattern = generator.Pattern(fields)
+        for id_ in first:
+            pattern.rank(id_)
+
+    def test_batch(self):
+        with mock.patch.object(generator, "NUMPY_MIN_BATCH", 1):
+            self._test_batch()
+
+    def test_batch_without_numpy(self):
+        with mock.patch.object(engine, "import_numpy", lambda: None):
+            self._test_batch()
+
+    def test_wide_space(self):
+        fields = build("MPL-[1-99999|z]-IDR-[1-99999]")
+        gen = generator.IdentifierGenerator(fields, 50000, seed=3)
+        with mock.patch.object(dedupe, "CHUNK_SIZE", 64):
+            ids = gen.generate_batch(20000) + gen.generate_batch(20000) + gen.generate_batch(10000)
+        self.assertEqual(len(set(ids)), 50000)
+        self.assertEqual(len(gen.produced), 50000)
+        ranks = list(gen.produced)
+        self.assertEqual(ranks, sorted(ranks))
+        pattern = generator.Pattern(fields)
+        self.assertEqual(sorted(ranks), sorted(pattern.rank(id_) for id_ in ids))
+
+
+class TestIdentifierGenerator(unittest.TestCase):
+
+    def test_whole_space(self):
+        ids = list(generator.IdentifierGenerator(build("DOC-[1-5|3z]"), 10))
+        self.assertEqual(sorted(ids), ["DOC-00{}".format(i) for i in range(1, 6)])
+
+    def test_bloom_filter(self):
+        fields = build("[0-999999999][0-999999999]")
+        gen = generator.IdentifierGenerator(fields, 5000, error_rate=0.001)
+        ids = list(gen) + gen.generate_batch(10)
+        self.assertEqual(len(ids), 5000)
+        self.assertEqual(len(set(ids)), 5000)
+
+    def test_bloom_filter_of_a_small_space(self):
+        fields = build("[1-2000]")
+        gen = generator.IdentifierGenerator(fields, 2000, error_rate=0.01)
+        self.assertIsInstance(gen.produced, dedupe.AdaptiveStore)
+        self.assertEqual(len(set(gen.generate_batch(2000))), 2000)
+        fields = build("[0-999999]")
+        gen = generator.IdentifierGenerator(fields, 600000, error_rate=0.01)
+        self.assertIsInstance(gen.produced, dedupe.AdaptiveStore)
+
+
+class TestSequentialIdentifierGenerator(unittest.TestCase):
+
+    def test_whole_space_in_order(self):
+        fields = build("MPL-[1-99|z]-IDR-[1-4]")
+        pattern = generator.Pattern(fields)
+        ids = list(generator.SequentialIdentifierGenerator(fields, 1000))
+        self.assertEqual(ids, [pattern.nth(i) for i in range(pattern.count)])
+
+    def test_start(self):
+        fields = build("[1-3][0-2]")
+        ids = list(generator.SequentialIdentifierGenerator(fields, 4, start=5))
+        self.assertEqual(ids, ["22", "30", "31", "32"])
+        self.assertEqual(list(generator.SequentialIdentifierGenerator(fields, 4, start=9)), [])
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_shares_are_disjoint(self):
+        fields = build("[1-10][1-7]")
+        for seed in (None, 5):
+            ids = []
+            for node_id in range(3):
+                gen = generator.IdentifierGenerator(fields, 100, node_id=node_id,
+                                                    node_count=3, seed=seed)
+                self.assertEqual(gen.remaining(), len(range(node_id, 70, 3)))
+                ids += list(gen)
+                self.assertEqual(gen.remaining(), 0)
+            self.assertEqual(len(ids), 70)
+            self.assertEqual(len(set(ids)), 70)
+
+    def test_permutation_shares_are_disjoint(self):
+        fields = build("[1-10][1-7]")
+        ids = []
+        for node_id in range(4):
+            gen = generator.PermutationIdentifierGenerator(fields, 10, seed=9, node_id=node_id,
+                                                           node_count=4)
+            ids += list(gen)
+            self.assertEqual(gen.remaining(), len(range(node_id, 70, 4)) - 10)
+        ids += list(parallel.generate(fields, 100, 2, seed=9, node_id=0, node_count=4,
+                                      chunk_size=3))[10:]
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_permutation_requires_seed(self):
+        with self.assertRaises(ValueError):
+            generator.PermutationIdentifierGenerator(build("[1-9]"), 3, node_count=2)
+
+
+class TestGenerateRanks(unittest.TestCase):
+
+    def test_same_identifiers(self):
+        fields = build("MPL-[1-999|z]-IDR-[1-4]")
+        pattern = generator.Pattern(fields)
+        makers = [lambda: generator.IdentifierGenerator(fields, 3000, seed=2),
+                  lambda: generator.IdentifierGenerator(fields, 3000, node_id=1, node_count=3,
+                                                        seed=2),
+                  lambda: generator.PermutationIdentifierGenerator(fields, 3000, seed=2),
+                  lambda: generator.SequentialIdentifierGenerator(fields, 3000, start=7),
+                  lambda: parallel.ThreadSafeIdentifierGenerator(fields, 3000, seed=2),
+                  lambda: parallel.ParallelIdentifierGenerator(fields, 3000, 2, seed=2)]
+        for make in makers:
+            gen = make()
+            ids = [id_ for block in iter(lambda: gen.generate_batch(700), []) for id_ in block]
+            gen = make()
+            ranks = [rank for block in iter(lambda: gen.generate_ranks(700), []) for rank in block]
+            self.assertGreater(len(ids), 1000)
+            self.assertEqual(len(set(ids)), len(ids))
+            self.assertEqual([pattern.nth(rank) for rank in ranks], ids)
+
+
+class TestAmbiguousPattern(unittest.TestCase):
+
+    def test_ambiguous(self):
+        for expr in ("[1-50][1-40]", "[1-50]12", "[1-999|2z][1-2]"):
+            self.assertTrue(generator.Pattern(build(expr)).ambiguous)
+        for expr in ("[1-50]-[1-40]", "[1-50|z][1-40]", "[1-9][1-40]", "[1-50]"):
+            self.assertFalse(generator.Pattern(build(expr)).ambiguous)
+
+    def test_random_identifiers_stay_unique(self):
+        fields = build("[1-20][1-20]")
+        ids = list(generator.IdentifierGenerator(fields, 300))
+        self.assertEqual(len(ids), len(set(ids)))
+        gen = generator.IdentifierGenerator(fields, 300)
+        ids = gen.generate_batch(300)
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_distinct_identifiers_end_the_draws(self):
+        fields = build("[1-20][1-20]")
+        ids = list(generator.IdentifierGenerator(fields, 400))
+        self.assertEqual(len(set(ids)), 391)
+        gen = generator.IdentifierGenerator(fields, 400, node_id=1, node_count=2)
+        ids = gen.generate_batch(400)
+        self.assertEqual(len(set(ids)), len(ids))
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def _test_resume(self, make):
+        first = make()
+        ids = first.generate_batch(150)
+        path = os.path.join(self.folder.name, "state.bin")
+        checkpoint.save(path, *first.getstate())
+        second = make()
+        second.setstate(*checkpoint.load(path))
+        ids += list(second)
+        self.assertEqual(len(ids), 400)
+        self.assertEqual(len(set(ids)), 400)
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_resume(self):
+        fields = build("MPL-[1-999|z]-IDR-[1-4]")
+        self._test_resume(lambda: generator.IdentifierGenerator(fields, 400))
+        self._test_resume(lambda: generator.IdentifierGenerator(fields, 400, error_rate=0.01))
+        self._test_resume(lambda: generator.PermutationIdentifierGenerator(fields, 400, seed=4))
+        self._test_resume(lambda: generator.SequentialIdentifierGenerator(fields, 400))
+        self._test_resume(lambda: parallel.ParallelIdentifierGenerator(fields, 400, 2, seed=4))
+        with self.assertRaises(ValueError):
+            parallel.ParallelIdentifierGenerator(fields, 400, 2, seed=None)
+
+    def test_seeded_resume_goes_on(self):
+        fields = build("MPL-[1-999|z]-IDR-[1-4]")
+        whole = generator.IdentifierGenerator(fields, 400, seed=3)
+        expected = whole.generate_batch(150) + list(whole)
+        first = generator.IdentifierGenerator(fields, 400, seed=3)
+        ids = first.generate_batch(150)
+        second = generator.IdentifierGenerator(fields, 400, seed=3)
+        second.setstate(*first.getstate())
+        self.assertEqual(ids + list(second), expected)
+        self.assertEqual(second.stats.collisions, whole.stats.collisions - first.stats.collisions)
+
+    def test_not_a_checkpoint(self):
+        path = os.path.join(self.folder.name, "state.bin")
+        with open(path, "wb") as f:
+            f.write(b"nothing")
+        with self.assertRaises(ValueError):
+            checkpoint.load(path)
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_matches_permutation_walk(self):
+        fields = build("MPL-[1-99|z]-IDR-[1-4]")
+        ids = list(parallel.generate(fields, 300, 2, seed=3, chunk_size=7))
+        expected = list(generator.PermutationIdentifierGenerator(fields, 300, seed=3))
+        self.assertEqual(ids, expected)
+
+    def test_whole_space(self):
+        fields = build("DOC-[1-5|3z]")
+        ids = list(parallel.generate(fields, 10, 3, chunk_size=2))
+        self.assertEqual(sorted(ids), ["DOC-00{}".format(i) for i in range(1, 6)])
+
+
+class TestStats(unittest.TestCase):
+
+    def test_next(self):
+        gen = generator.IdentifierGenerator(build("[1-200]"), 200, seed=1)
+        reports = []
+        gen.stats = gen.make_stats(reports.append, every=50)
+        with self.assertLogs("telemetry", "WARNING"):
+            list(gen)
+        stats = gen.stats.as_dict()
+        self.assertEqual(stats["produced"], 200)
+        self.assertEqual(stats["fill_ratio"], 1.0)
+        self.assertEqual(sum(stats["attempts"].values()), 200)
+        self.assertGreater(stats["collisions"], 0)
+        self.assertEqual(len(reports), 4)
+
+    def test_batch(self):
+        gen = generator.IdentifierGenerator(build("[1-1000]"), 100, seed=1)
+        self.assertEqual(len(gen.generate_batch(100)), 100)
+        stats = gen.stats.as_dict()
+        self.assertEqual((stats["produced"], stats["fill_ratio"]), (100, 0.1))
+        self.assertEqual(set(stats["seconds"]), {"draw", "dedupe", "format"})
+
+
+class TestThreadSafeIdentifierGenerator(unittest.TestCase):
+
+    def test_threads(self):
+        fields = build("MPL-[1-99|z]-IDR-[1-40]")
+        gen = parallel.ThreadSafeIdentifierGenerator(fields, 3000, seed=5, block_size=16)
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            parts = list(executor.map(lambda n: gen.generate_batch(n) + list(gen), [300] * 4))
+        ids = [id_ for part in parts for id_ in part]
+        self.assertEqual(len(ids), 3000)
+        self.assertEqual(len(set(ids)), 3000)
+
+    def test_whole_space(self):
+        gen = parallel.ThreadSafeIdentifierGenerator(build("DOC-[1-5|3z]"), 10, block_size=2)
+        self.assertEqual(sorted(gen), ["DOC-00{}".format(i) for i in range(1, 6)])
+        self.assertEqual(gen.remaining(), 0)
+
+    def test_resume(self):
+        fields = build("[1-999|z]")
+        gen = parallel.ThreadSafeIdentifierGenerator(fields, 500, seed=2)
+        first = gen.generate_batch(200)
+        resumed = parallel.ThreadSafeIdentifierGenerator(fields, 500, seed=2)
+        resumed.setstate(*gen.getstate())
+        walk = generator.PermutationIdentifierGenerator(fields, 500, seed=2)
+        self.assertEqual(first + list(resumed), list(walk))
+
+
+if __name__ == "__main__":
+    unittest.main()
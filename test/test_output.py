@@ -0,0 +1,78 @@
+import os
+import unittest
+
+import fix_import
+import exprparse
+import output
+
+
+class TestWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def tearDown(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def test_chunks(self):
+        writer = output.Writer(self.write_fd, buffer_size=8)
+        writer.write(["A-1"])
+        self.assertEqual(writer.pending, 4)
+        writer.write(["A-2", "A-3"])
+        self.assertEqual(writer.pending, 0)
+        writer.write([])
+        writer.flush()
+        self.assertEqual(os.read(self.read_fd, 100), b"A-1\nA-2\nA-3\n")
+
+    def test_broken_pipe(self):
+        writer = output.Writer(self.write_fd)
+        writer.write(["A-1"])
+        os.close(self.read_fd)
+        self.read_fd = os.open(os.devnull, os.O_RDONLY)
+        self.assertRaises(BrokenPipeError, writer.flush)
+
+
+class TestFormats(unittest.TestCase):
+
+    def setUp(self):
+        self.pattern = exprparse.compile("A,[1-9]-[1-99|z]")
+
+    def encode(self, format_, ids):
+        read_fd, write_fd = os.pipe()
+        writer = output.Writer(write_fd, format_=format_, pattern=self.pattern)
+        writer.write([self.pattern.rank(id_) for id_ in ids] if writer.by_rank else ids)
+        writer.flush()
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as f:
+            return f.read()
+
+    def test_text(self):
+        self.assertEqual(self.encode("nul", ["A,4-96", "A,3-05"]), b"A,4-96\0A,3-05\0")
+        self.assertEqual(self.encode("ndjson", ["A,4-96"]), b'{"id": "A,4-96", "fields": [4, 96]}\n')
+        self.assertEqual(self.encode("csv", ["A,4-96", "A,3-05"]),
+                         b'id,field1,field2\n"A,4-96",4,96\n"A,3-05",3,5\n')
+
+    def test_binary(self):
+        ids = ["A,4-96", "A,1-01", "A,9-99"]
+        expression, space, ranks = output.read_ranks(self.encode("binary", ids))
+        self.assertEqual((expression, space), ("A,[1-9]-[1-99|z]", 891))
+        self.assertEqual(list(ranks), [392, 0, 890])
+        self.assertEqual([self.pattern.nth(rank) for rank in ranks], ids)
+
+    def test_no_header(self):
+        read_fd, write_fd = os.pipe()
+        writer = output.Writer(write_fd, format_="csv", pattern=self.pattern, header=False)
+        writer.write([392])
+        writer.flush()
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as f:
+            self.assertEqual(f.read(), b'"A,4-96",4,96\n')
+
+    def test_wide_binary(self):
+        pattern = exprparse.compile("[1-99999999999][1-99999999999]")
+        self.assertRaises(ValueError, output.Writer, 1, format_="binary", pattern=pattern)
+
+
+if __name__ == "__main__":
+    unittest.main()
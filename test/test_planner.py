@@ -0,0 +1,76 @@
+import unittest
+
+import fix_import
+import exprparse
+import planner
+
+
+def build(pattern):
+    return exprparse.Source(pattern).parse_and_build()
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_choices(self):
+        memory = 2**30
+        self.assertEqual(planner.plan(10**12, 100, memory).strategy, "set")
+        self.assertEqual(planner.plan(10**6, 10**6, memory).strategy, "shuffle")
+        self.assertEqual(planner.plan(10**6, 10**6, 10**5).strategy, "permutation")
+        # the permutation of this space walks 4 times per identifier
+        self.assertEqual(planner.plan(2**60 + 1, 10**7, 5 * 10**7).strategy, "bloom")
+        self.assertEqual(planner.plan(2**60 + 1, 10**12, 10**9).strategy, "permutation")
+        self.assertEqual(planner.plan(10**30, 10**8, 10**9).strategy, "permutation")
+
+    def test_explain(self):
+        text = planner.plan(10**12, 100, 2**30).explain()
+        self.assertIn("strategy: set (random draws, remembered by an adaptive store)", text)
+        self.assertIn("estimated memory: 800 B", text)
+
+    def test_empty_share(self):
+        for space, limit in ((0, 10), (10, 0)):
+            plan = planner.plan(space, limit, 2**30)
+            self.assertEqual((plan.strategy, plan.memory), ("permutation", 0))
+            self.assertIn("0.00%", plan.explain())
+        self.assertEqual(planner.estimate("permutation", 0, 0), (0, 0.0))
+
+    def test_expected_attempts(self):
+        self.assertAlmostEqual(planner.expected_attempts(1000, 500), 1000 * 0.6931, places=0)
+        self.assertGreater(planner.expected_attempts(1000, 1000), 7000)
+
+
+class TestPlannedIdentifierGenerator(unittest.TestCase):
+
+    def test_shuffle(self):
+        gen = planner.build("shuffle", build("A-[1-999|z]"), 999, seed=1)
+        ids = gen.generate_batch(500) + list(gen)
+        self.assertEqual(sorted(ids), ["A-{:03}".format(i) for i in range(1, 1000)])
+
+    def test_shuffled_ranks(self):
+        gen = planner.build("bitmap", build("A-[1-999|z]"), 999, seed=1)
+        ranks = gen.generate_ranks(100)
+        gen.switch()
+        ranks += gen.generate_ranks(2000)
+        self.assertEqual(sorted(ranks), list(range(999)))
+
+    def test_switch(self):
+        gen = planner.build("bitmap", build("A-[1-2000|z]"), 2000, seed=1)
+        with self.assertLogs("planner", "INFO"):
+            ids = [id_ for block in iter(lambda: gen.generate_batch(300), []) for id_ in block]
+        self.assertIsNotNone(gen.left)
+        self.assertEqual(len(set(ids)), 2000)
+
+    def test_resume_after_switch(self):
+        fields = build("A-[1-2000|z]")
+        gen = planner.build("shuffle", fields, 2000, seed=1)
+        first = gen.generate_batch(1200)
+        resumed = planner.build("shuffle", fields, 2000, seed=2)
+        resumed.setstate(*gen.getstate())
+        self.assertEqual(len(set(first + list(resumed))), 2000)
+
+    def test_permutation(self):
+        gen = planner.build("permutation", build("A-[1-20]"), 20, seed=1)
+        self.assertEqual(len(set(gen)), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
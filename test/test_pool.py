@@ -0,0 +1,63 @@
+import unittest
+
+import fix_import
+import generator
+import pool
+
+
+class TestIdentifierPool(unittest.TestCase):
+
+    def test_take_all(self):
+        gen = generator.IdentifierGenerator([generator.RangeGenerator(1, 500, False)], 500, seed=1)
+        with pool.IdentifierPool(gen, size=64, low_water=16, batch=32) as ids:
+            taken = [ids.take() for _ in range(500)]
+            self.assertRaises(IndexError, ids.take)
+            stats = ids.stats()
+        self.assertEqual(sorted(map(int, taken)), list(range(1, 501)))
+        self.assertEqual(stats["hits"] + stats["stalls"], 501)
+        self.assertEqual(stats["ready"], 0)
+
+    def test_iterate(self):
+        gen = generator.SequentialIdentifierGenerator([generator.RangeGenerator(1, 9, False)], 9)
+        with pool.IdentifierPool(gen, size=4) as ids:
+            self.assertEqual(list(ids), [str(i) for i in range(1, 10)])
+
+    def test_prefilled(self):
+        gen = generator.SequentialIdentifierGenerator([generator.RangeGenerator(1, 100, False)], 100)
+        with pool.IdentifierPool(gen, size=50, low_water=10, batch=50) as ids:
+            with ids.condition:
+                ids.condition.wait_for(lambda: ids.buffer)
+            self.assertEqual(ids.take(), "1")
+            self.assertEqual(ids.stats()["hits"], 1)
+
+    def test_filled_up_to_size(self):
+        gen = generator.IdentifierGenerator([generator.RangeGenerator(1, 10000, False)], 10000, seed=1)
+        with pool.IdentifierPool(gen, size=1000, low_water=100, batch=50) as ids:
+            with ids.condition:
+                ids.condition.wait_for(lambda: len(ids.buffer) == 1000, timeout=10)
+            self.assertEqual(ids.stats()["ready"], 1000)
+            for _ in range(901):
+                ids.take()
+            with ids.condition:
+                ids.condition.wait_for(lambda: len(ids.buffer) == 1000, timeout=10)
+            self.assertEqual(ids.stats()["ready"], 1000)
+
+    def test_generator_error(self):
+        class Failing:
+            def generate_batch(self, n):
+                raise RuntimeError("no more entropy")
+
+        with pool.IdentifierPool(Failing(), size=8) as ids:
+            self.assertRaises(RuntimeError, ids.take)
+            self.assertRaises(RuntimeError, ids.take)
+
+    def test_low_water(self):
+        gen = generator.SequentialIdentifierGenerator([generator.RangeGenerator(1, 9, False)], 9)
+        self.assertRaises(ValueError, pool.IdentifierPool, gen, size=8, low_water=0)
+        self.assertRaises(ValueError, pool.IdentifierPool, gen, size=8, low_water=9)
+        with pool.IdentifierPool(gen, size=2) as ids:
+            self.assertEqual(len(list(ids)), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
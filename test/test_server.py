@@ -0,0 +1,70 @@
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+import fix_import
+import server
+
+
+def answer(srv, line):
+    return asyncio.run(srv.answer(line))
+
+
+class TestAnswer(unittest.TestCase):
+
+    def test_get(self):
+        srv = server.IdentifierServer()
+        first = answer(srv, "GET DOC-[1-5|3z] 2\n").splitlines()
+        second = answer(srv, "GET DOC-[1-5|3z] 9\n").splitlines()
+        self.assertEqual((first[0], second[0]), ("OK 2", "OK 3"))
+        self.assertEqual(sorted(first[1:] + second[1:]), ["DOC-00{}".format(i) for i in range(1, 6)])
+        self.assertEqual(answer(srv, "GET DOC-[1-5|3z] 1\n"), "OK 0\n")
+
+    def test_pattern_with_spaces(self):
+        srv = server.IdentifierServer()
+        self.assertEqual(answer(srv, "GET A B[1-1] 1\n"), "OK 1\nA B1\n")
+
+    def test_ambiguous_pattern(self):
+        srv = server.IdentifierServer()
+        ids = answer(srv, "GET [1-20][1-20] 400\n").splitlines()
+        self.assertEqual(ids[0], "OK 391")
+        self.assertEqual(len(set(ids[1:])), 391)
+        self.assertTrue(answer(srv, "GET [1-999][1-999] 1\n").startswith("ERR "))
+
+    def test_errors(self):
+        srv = server.IdentifierServer()
+        for line in ("PUT A 1", "GET A", "GET A x", "GET [1- 1", "GET A[1-2] 99999999"):
+            self.assertTrue(answer(srv, line + "\n").startswith("ERR "), line)
+
+
+class TestServer(unittest.TestCase):
+
+    def test_pipelined_requests(self):
+        folder = tempfile.TemporaryDirectory()
+        path = os.path.join(folder.name, "idgen.sock")
+
+        async def run():
+            srv = await server.IdentifierServer().start(path)
+            async with srv:
+                reader, writer = await asyncio.open_unix_connection(path)
+                writer.write(b"GET X-[1-100] 60\nGET X-[1-100] 60\n")
+                await writer.drain()
+                answers = []
+                for _ in range(2):
+                    count = int((await reader.readline()).split()[1])
+                    answers.append([(await reader.readline()).strip() for _ in range(count)])
+                writer.close()
+                return answers
+
+        try:
+            first, second = asyncio.run(run())
+        finally:
+            folder.cleanup()
+        self.assertEqual((len(first), len(second)), (60, 40))
+        self.assertEqual(len(set(first + second)), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()